@@ -5,37 +5,58 @@
 #E-mail: akihiro.ezoe@riken.jp
 
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+matplotlib.rcParams['interactive'] = False
+matplotlib.rcParams['figure.max_open_warning'] = 0
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.patches import Rectangle
+from matplotlib.collections import LineCollection
 from matplotlib.colors import LinearSegmentedColormap
 import matplotlib.colors as mcolors
 import argparse
 import json
 import os
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+CLUSTERED_DATA_DTYPES = {'X': np.float64, 'Y': np.float64, 'Cluster': np.int64}
+CALCULATED_POINTS_DTYPES = {
+    'Group': np.int64,
+    'X_Mean': np.float64,
+    'Y_Calculated_Mean': np.float64,
+    'X_Median': np.float64,
+    'Y_Calculated_Median': np.float64,
+    'g_num': np.int64,
+}
 
 
 def apply_log2_transform(data, min_value=1e-10):
     data = np.array(data, dtype=float)
-    data = np.where(data <= 0, min_value, data)
-    return np.log2(data), 0
+    np.copyto(data, min_value, where=data <= 0)
+    return np.log2(data, out=data), 0
 
 
 def draw_half_boxplot(ax, data, position, width, side='left',
                       facecolor='lightgray', edgecolor='gray', alpha=0.7,
                       show_outliers=True):
-    data = np.array(data)
+    data = np.asarray(data)
+    sorted_data = np.sort(data)
 
-    q1 = np.percentile(data, 25)
-    median = np.percentile(data, 50)
-    q3 = np.percentile(data, 75)
+    q1, median, q3 = np.percentile(sorted_data, [25, 50, 75])
     iqr = q3 - q1
 
     lower_whisker = q1 - 1.5 * iqr
     upper_whisker = q3 + 1.5 * iqr
 
-    whisker_min = data[data >= lower_whisker].min()
-    whisker_max = data[data <= upper_whisker].max()
+    whisker_min = sorted_data[np.searchsorted(sorted_data, lower_whisker, side='left')]
+    whisker_max = sorted_data[np.searchsorted(sorted_data, upper_whisker, side='right') - 1]
 
     outliers = data[(data < lower_whisker) | (data > upper_whisker)]
 
@@ -108,8 +129,12 @@ def export_json(output_path, boxplot_data, lines_data, stats):
         'boxplots': boxplot_data,
         'lines': lines_data
     }
-    with open(output_path, 'w') as f:
-        json.dump(json_data, f, indent=2)
+    if orjson is not None:
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(json_data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(output_path, 'w') as f:
+            json.dump(json_data, f, indent=2)
 
 
 def export_html(output_path, svg_content, title):
@@ -131,10 +156,37 @@ def export_html(output_path, svg_content, title):
     </div>
 </body>
 </html>'''
-    with open(output_path, 'w') as f:
+    with open(output_path, 'w', buffering=1 << 20) as f:
         f.write(html_content)
 
 
+def read_table(path, dtype):
+    return pd.read_csv(path, sep=r'\s+', engine='c', header=0, dtype=dtype, memory_map=True)
+
+
+def cached_read_table(path, dtype, use_cache=True, log2_columns=()):
+    cache_path = path + ('.log2.npz' if log2_columns else '.npz')
+    if (use_cache and os.path.exists(cache_path)
+            and os.stat(cache_path).st_mtime_ns > os.stat(path).st_mtime_ns):
+        with np.load(cache_path, allow_pickle=False) as cached:
+            df = pd.DataFrame({name: cached[name] for name in cached.files})
+        # Another script may have written the cache with its own column dtypes.
+        return df.astype({name: t for name, t in dtype.items() if name in df.columns})
+    df = read_table(path, dtype)
+    for name in log2_columns:
+        df[name], _ = apply_log2_transform(df[name])
+    if use_cache:
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **{name: df[name].to_numpy() for name in df.columns})
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+    return df
+
+
+@lru_cache(maxsize=16)
 def create_truncated_colormap(cmap_name, vmin=0.3, vmax=1.0):
     cmap = plt.get_cmap(cmap_name)
     colors = cmap(np.linspace(vmin, vmax, 256))
@@ -153,24 +205,29 @@ def main():
                         help='Apply log2 transformation to values')
     parser.add_argument('--show-numbers', action='store_true',
                         help='Display cluster numbers (g_num) on lines')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always re-parse input files instead of using the parsed-table cache')
     args = parser.parse_args()
 
-    cluster_data = pd.read_csv('output_EZ/clustered_data.txt', sep=r'\s+')
-    calculated_points = pd.read_csv('output_EZ/calculated_points.txt', sep=r'\s+')
-
     marker_file = 'output_EZ/.log2_transformed'
     already_transformed = os.path.exists(marker_file)
 
     use_log2 = args.log2
-    if use_log2 and not already_transformed:
+    transform_inputs = use_log2 and not already_transformed
+    if transform_inputs:
         print("Applying log2 transformation...")
-        cluster_data['X'], _ = apply_log2_transform(cluster_data['X'])
-        cluster_data['Y'], _ = apply_log2_transform(cluster_data['Y'])
-        calculated_points['X_Mean'], _ = apply_log2_transform(calculated_points['X_Mean'])
-        calculated_points['Y_Calculated_Mean'], _ = apply_log2_transform(calculated_points['Y_Calculated_Mean'])
     elif use_log2 and already_transformed:
         print("Data already log2 transformed in preparation step, skipping transformation.")
 
+    # Transformed tables get their own cache so later runs skip both parsing and log2.
+    use_cache = not args.no_cache
+    cluster_data = cached_read_table(
+        'output_EZ/clustered_data.txt', CLUSTERED_DATA_DTYPES, use_cache,
+        log2_columns=('X', 'Y') if transform_inputs else ())
+    calculated_points = cached_read_table(
+        'output_EZ/calculated_points.txt', CALCULATED_POINTS_DTYPES, use_cache,
+        log2_columns=('X_Mean', 'Y_Calculated_Mean') if transform_inputs else ())
+
     if args.output_prefix:
         base_name = f'output_EZ/{args.output_prefix}_boxplot_with_lines'
     else:
@@ -216,14 +273,15 @@ def main():
     boxplot_data = []
 
     show_outliers = not args.no_outliers
+    xy_values = cluster_data[['X', 'Y']].to_numpy(dtype=float)
 
-    bp_x = draw_half_boxplot(ax, cluster_data['X'], position=x_pos, width=box_width,
+    bp_x = draw_half_boxplot(ax, xy_values[:, 0], position=x_pos, width=box_width,
                       side='left', facecolor='lightgray', edgecolor='gray',
                       show_outliers=show_outliers)
     bp_x['label'] = 'X'
     boxplot_data.append(bp_x)
 
-    bp_y = draw_half_boxplot(ax, cluster_data['Y'], position=y_pos, width=box_width,
+    bp_y = draw_half_boxplot(ax, xy_values[:, 1], position=y_pos, width=box_width,
                       side='right', facecolor='lightgray', edgecolor='gray',
                       show_outliers=show_outliers)
     bp_y['label'] = 'Y'
@@ -234,12 +292,11 @@ def main():
     x_whisker_min, x_whisker_max = bp_x['whisker_min'], bp_x['whisker_max']
     y_whisker_min, y_whisker_max = bp_y['whisker_min'], bp_y['whisker_max']
 
-    calculated_points_filtered = calculated_points[
-        (calculated_points['X_Mean'] >= x_whisker_min) &
-        (calculated_points['X_Mean'] <= x_whisker_max) &
-        (calculated_points['Y_Calculated_Mean'] >= y_whisker_min) &
-        (calculated_points['Y_Calculated_Mean'] <= y_whisker_max)
-    ].copy()
+    xm = calculated_points['X_Mean'].to_numpy()
+    ym = calculated_points['Y_Calculated_Mean'].to_numpy()
+    in_whiskers = ((xm >= x_whisker_min) & (xm <= x_whisker_max) &
+                   (ym >= y_whisker_min) & (ym <= y_whisker_max))
+    calculated_points_filtered = calculated_points.iloc[in_whiskers]
 
     filtered_count = len(calculated_points) - len(calculated_points_filtered)
     if filtered_count > 0:
@@ -247,48 +304,76 @@ def main():
 
     if len(calculated_points_filtered) == 0:
         print("Warning: All clusters filtered out. Using original data.")
-        calculated_points_filtered = calculated_points.copy()
+        calculated_points_filtered = calculated_points
 
     g_num_min = calculated_points_filtered['g_num'].min()
     g_num_max = calculated_points_filtered['g_num'].max()
 
-    lines_data = []
-
-    for _, row in calculated_points_filtered.iterrows():
-        norm_g_num = (row['g_num'] - g_num_min) / (g_num_max - g_num_min) if g_num_max > g_num_min else 0.5
-
-        color = plt.cm.Blues(0.3 + 0.7 * norm_g_num)
+    g_nums = calculated_points_filtered['g_num'].to_numpy()
+    x_means = calculated_points_filtered['X_Mean'].to_numpy(dtype=float)
+    y_means = calculated_points_filtered['Y_Calculated_Mean'].to_numpy(dtype=float)
+    groups = (calculated_points_filtered['Group'].to_numpy()
+              if 'Group' in calculated_points_filtered.columns else None)
 
-        color_hex = '#{:02x}{:02x}{:02x}'.format(int(color[0]*255), int(color[1]*255), int(color[2]*255))
-
-        line_width = 1 + 4 * norm_g_num
-
-        ax.plot([x_pos, y_pos], [row['X_Mean'], row['Y_Calculated_Mean']],
-                 color=color, linewidth=line_width, solid_capstyle='round',
-                 zorder=int(10 + 90 * norm_g_num))
-
-        if args.show_numbers:
-            mid_x = (x_pos + y_pos) / 2
-            mid_y = (row['X_Mean'] + row['Y_Calculated_Mean']) / 2
-            ax.text(mid_x, mid_y + 0.02 * (y_whisker_max - y_whisker_min),
-                    str(int(row['g_num'])), fontsize=7,
-                    color=color, ha='center', va='bottom',
-                    zorder=int(10 + 90 * norm_g_num) + 1)
-
-        is_ascending = row['Y_Calculated_Mean'] > row['X_Mean']
-
-        lines_data.append({
-            'group': int(row['Group']) if 'Group' in row else None,
-            'x_start': x_pos,
-            'x_end': y_pos,
-            'y_start': float(row['X_Mean']),
-            'y_end': float(row['Y_Calculated_Mean']),
-            'g_num': int(row['g_num']),
-            'direction': 'ascending' if is_ascending else 'descending',
-            'color': color_hex,
-            'line_width': float(line_width),
-            'norm_g_num': float(norm_g_num)
-        })
+    if g_num_max > g_num_min:
+        norm_g_nums = (g_nums - g_num_min) / (g_num_max - g_num_min)
+    else:
+        norm_g_nums = np.full(len(g_nums), 0.5)
+
+    colors = plt.cm.Blues(0.3 + 0.7 * norm_g_nums)
+    line_widths = 1 + 4 * norm_g_nums
+
+    # One (start, end) segment per cluster; rows are sorted by g_num.
+    segments = np.stack([
+        np.column_stack([np.full_like(x_means, x_pos), x_means]),
+        np.column_stack([np.full_like(y_means, y_pos), y_means]),
+    ], axis=1)
+    # Each line sits at zorder 10 + 90 * norm_g_num with its label one above,
+    # so a label is covered by the lines of sufficiently larger clusters. With
+    # labels, one collection per zorder level (at most 91), each followed by its
+    # labels, keeps that stacking; without them, a single collection with the
+    # segments in zorder order draws the same image.
+    line_zorders = (10 + 90 * norm_g_nums).astype(int)
+    line_collections = []
+    if args.show_numbers:
+        mid_x = (x_pos + y_pos) / 2
+        label_ys = (x_means + y_means) / 2 + 0.02 * (y_whisker_max - y_whisker_min)
+        for zorder in np.unique(line_zorders).tolist():
+            level = np.flatnonzero(line_zorders == zorder)
+            lc = LineCollection(segments[level], colors=colors[level],
+                                linewidths=line_widths[level],
+                                capstyle='round', zorder=zorder)
+            ax.add_collection(lc)
+            line_collections.append(lc)
+            for i in level.tolist():
+                ax.text(mid_x, label_ys[i],
+                        str(int(g_nums[i])), fontsize=7,
+                        color=colors[i], ha='center', va='bottom',
+                        zorder=zorder + 1)
+    else:
+        order = np.argsort(line_zorders, kind='stable')
+        lc = LineCollection(segments[order], colors=colors[order],
+                            linewidths=line_widths[order],
+                            capstyle='round', zorder=10)
+        ax.add_collection(lc)
+        line_collections.append(lc)
+    ax.autoscale_view()
+
+    rgb8 = (colors[:, :3] * 255).astype(np.uint8)
+    color_hexes = ['#%02x%02x%02x' % tuple(rgb) for rgb in rgb8]
+
+    lines_data = pd.DataFrame({
+        'group': groups.astype(np.int64) if groups is not None else None,
+        'x_start': x_pos,
+        'x_end': y_pos,
+        'y_start': x_means,
+        'y_end': y_means,
+        'g_num': g_nums.astype(np.int64),
+        'direction': np.where(y_means > x_means, 'ascending', 'descending'),
+        'color': color_hexes,
+        'line_width': line_widths,
+        'norm_g_num': norm_g_nums,
+    }).to_dict(orient='records')
 
     ax.set_xticks([x_pos, y_pos])
     ax.set_xticklabels(['X', 'Y'])
@@ -322,13 +407,21 @@ def main():
         export_json(output_filename, boxplot_data, lines_data, stats)
     elif args.format == 'html':
         import io
-        svg_buffer = io.StringIO()
-        plt.savefig(svg_buffer, format='svg')
-        svg_content = svg_buffer.getvalue()
-        svg_content = svg_content[svg_content.find('<svg'):]
+        svg_buffer = io.BytesIO()
+        with plt.rc_context({'path.simplify': True, 'path.simplify_threshold': 1.0}):
+            plt.savefig(svg_buffer, format='svg')
+        svg_bytes = svg_buffer.getvalue()
+        svg_content = svg_bytes[svg_bytes.find(b'<svg'):].decode('utf-8')
         export_html(output_filename, svg_content, title)
     else:
-        plt.savefig(output_filename, format=args.format, dpi=300 if args.format == 'png' else None)
+        if args.format == 'pdf':
+            # Rasterize the many line/boxplot artists so large runs stay small,
+            # keeping labels, ticks and the colorbar as vectors. SVG output is
+            # left fully vectorized for editing.
+            for lc in line_collections:
+                lc.set_rasterized(True)
+            ax.set_rasterization_zorder(5)
+        plt.savefig(output_filename, format=args.format, dpi=300 if args.format in ('png', 'pdf') else None)
 
     plt.close()
 
@@ -4,40 +4,122 @@
 #Commercial use is prohibited without a separate license agreement.
 #E-mail: akihiro.ezoe@riken.jp
 
-import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+matplotlib.rcParams['interactive'] = False
+matplotlib.rcParams['figure.max_open_warning'] = 0
 import matplotlib.pyplot as plt
 import numpy as np
 import os
 import matplotlib.colors as mcolors
-from matplotlib.patches import Polygon, Rectangle
+from matplotlib.patches import Rectangle
+from matplotlib.collections import LineCollection, PolyCollection
 from matplotlib.backends.backend_pdf import PdfPages
 from matplotlib.colors import LinearSegmentedColormap
 import argparse
 import json
 import io
+import math
+from datetime import datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optional: with Numba installed, the log2 clamp runs as one parallel compiled
+# pass (cached on disk after the first run).
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+
+HEX_LUT = np.array([f'{i:02x}' for i in range(256)])
+
+
+def rgb_to_hex(rgba):
+    rgb8 = (rgba[:, :3] * 255).astype(np.uint8)
+    hex_codes = np.char.add(np.char.add(np.char.add('#', HEX_LUT[rgb8[:, 0]]),
+                                        HEX_LUT[rgb8[:, 1]]),
+                            HEX_LUT[rgb8[:, 2]])
+    return hex_codes.tolist()
+
+
+def read_columns(path, delimiter=None):
+    with open(path) as f:
+        names = f.readline().strip().split(delimiter)
+    data = np.loadtxt(path, delimiter=delimiter, skiprows=1, ndmin=2)
+    return {name: data[:, i] for i, name in enumerate(names)}
+
+
+def load_columns(path, delimiter=None, use_cache=True, log2_columns=()):
+    cache_path = path + ('.log2.npz' if log2_columns else '.npz')
+    if (use_cache and os.path.exists(cache_path)
+            and os.stat(cache_path).st_mtime_ns > os.stat(path).st_mtime_ns):
+        with np.load(cache_path, allow_pickle=False) as cached:
+            return {name: cached[name].astype(float) for name in cached.files}
+    columns = read_columns(path, delimiter)
+    for name in log2_columns:
+        columns[name], _ = apply_log2_transform(columns[name])
+    if use_cache:
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **columns)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+    return columns
+
+
+def arrow_positions(start, stop, single, count):
+    if count > 1:
+        return np.linspace(start, stop, count)
+    return np.full(count, single, dtype=float)
+
+
+def select_rows(columns, index):
+    return {name: values[index] for name, values in columns.items()}
+
+
+def _log2_clamp_loop(x, out, min_value):
+    for i in prange(x.size):
+        v = x[i]
+        if v <= 0:
+            v = min_value
+        out[i] = math.log2(v)
+
+
+if njit is not None:
+    _log2_clamp = njit(parallel=True, cache=True)(_log2_clamp_loop)
+else:
+    _log2_clamp = None
 
 
 def apply_log2_transform(data, min_value=1e-10):
     data = np.array(data, dtype=float)
-    data = np.where(data <= 0, min_value, data)
-    return np.log2(data), 0
+    if _log2_clamp is not None and data.ndim == 1:
+        out = np.empty_like(data)
+        _log2_clamp(data, out, min_value)
+        return out, 0
+    np.copyto(data, min_value, where=data <= 0)
+    return np.log2(data, out=data), 0
 
 
 def draw_half_boxplot(ax, data, position, width, side='left',
                       facecolor='lightgray', edgecolor='gray', alpha=0.7,
                       show_outliers=True):
-    data = np.array(data)
+    sorted_data = np.sort(data)
 
-    q1 = np.percentile(data, 25)
-    median = np.percentile(data, 50)
-    q3 = np.percentile(data, 75)
+    q1, median, q3 = np.percentile(sorted_data, [25, 50, 75])
     iqr = q3 - q1
 
     lower_whisker = q1 - 1.5 * iqr
     upper_whisker = q3 + 1.5 * iqr
 
-    whisker_min = data[data >= lower_whisker].min()
-    whisker_max = data[data <= upper_whisker].max()
+    whisker_min = sorted_data[np.searchsorted(sorted_data, lower_whisker, side='left')]
+    whisker_max = sorted_data[np.searchsorted(sorted_data, upper_whisker, side='right') - 1]
 
     half_width = width / 2
 
@@ -103,8 +185,12 @@ def export_json(output_path, boxplot_data, arrows_data, stats, axis_info):
         'boxplots': boxplot_data,
         'arrows': arrows_data
     }
-    with open(output_path, 'w') as f:
-        json.dump(json_data, f, indent=2)
+    if orjson is not None:
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(json_data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(output_path, 'w') as f:
+            json.dump(json_data, f, indent=2)
 
 
 def export_html(output_path, svg_content, title):
@@ -148,24 +234,30 @@ def main():
                         help='Apply log2 transformation to values')
     parser.add_argument('--show-numbers', action='store_true',
                         help='Display cluster numbers (g_num) on arrows')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always re-parse input files instead of using the parsed-table cache')
     args = parser.parse_args()
 
-    clustered_data = pd.read_csv('output_EZ/clustered_data.txt', sep=' ')
-    calculated_points = pd.read_csv('output_EZ/calculated_points.txt', sep='\t')
-
     marker_file = 'output_EZ/.log2_transformed'
     already_transformed = os.path.exists(marker_file)
 
     use_log2 = args.log2
-    if use_log2 and not already_transformed:
+    transform_inputs = use_log2 and not already_transformed
+    if transform_inputs:
         print("Applying log2 transformation...")
-        clustered_data['X'], _ = apply_log2_transform(clustered_data['X'])
-        clustered_data['Y'], _ = apply_log2_transform(clustered_data['Y'])
-        calculated_points['X_Mean'], _ = apply_log2_transform(calculated_points['X_Mean'])
-        calculated_points['Y_Calculated_Mean'], _ = apply_log2_transform(calculated_points['Y_Calculated_Mean'])
     elif use_log2 and already_transformed:
         print("Data already log2 transformed in preparation step, skipping transformation.")
 
+    # Parsed (and, with --log2, transformed) inputs are cached in .npz files
+    # next to each source file and reused until the source changes.
+    use_cache = not args.no_cache
+    clustered_data = load_columns(
+        'output_EZ/clustered_data.txt', use_cache=use_cache,
+        log2_columns=('X', 'Y') if transform_inputs else ())
+    calculated_points = load_columns(
+        'output_EZ/calculated_points.txt', delimiter='\t', use_cache=use_cache,
+        log2_columns=('X_Mean', 'Y_Calculated_Mean') if transform_inputs else ())
+
     if args.output_prefix:
         base_name = f'output_EZ/{args.output_prefix}_arrow_boxplot_chart'
     else:
@@ -177,7 +269,7 @@ def main():
     else:
         output_filename = f'{base_name}.{args.format}'
 
-    total_pairs = len(clustered_data)
+    total_pairs = len(clustered_data['X'])
     differences = clustered_data['Y'] - clustered_data['X']
     positive_count = int((differences > 0).sum())
     negative_count = int((differences < 0).sum())
@@ -230,22 +322,24 @@ def main():
     bp_y['label'] = 'Y'
     boxplot_data.append(bp_y)
 
-    calculated_points_filtered = calculated_points[
+    in_whiskers = (
         (calculated_points['X_Mean'] >= whisker1_min) &
         (calculated_points['X_Mean'] <= whisker1_max) &
         (calculated_points['Y_Calculated_Mean'] >= whisker2_min) &
         (calculated_points['Y_Calculated_Mean'] <= whisker2_max)
-    ].copy()
+    )
+    calculated_points_filtered = select_rows(calculated_points, in_whiskers)
 
-    filtered_count = len(calculated_points) - len(calculated_points_filtered)
+    filtered_count = int(in_whiskers.size - in_whiskers.sum())
     if filtered_count > 0:
         print(f"Filtered out {filtered_count} cluster(s) outside whisker range")
 
-    if len(calculated_points_filtered) == 0:
+    if not in_whiskers.any():
         print("Warning: All clusters filtered out. Using original data.")
-        calculated_points_filtered = calculated_points.copy()
+        calculated_points_filtered = calculated_points
 
-    calculated_points_sorted = calculated_points_filtered.sort_values('g_num', ascending=False)
+    order = np.argsort(-calculated_points_filtered['g_num'], kind='stable')
+    calculated_points_sorted = select_rows(calculated_points_filtered, order)
     max_g_num = calculated_points_filtered['g_num'].max()
     min_g_num = calculated_points_filtered['g_num'].min()
 
@@ -253,42 +347,36 @@ def main():
     arrow_width = 0.15
     arrow_gap = 0.02
 
-    ascending_points = calculated_points_sorted[
+    ascending_points = select_rows(
+        calculated_points_sorted,
         calculated_points_sorted['Y_Calculated_Mean'] > calculated_points_sorted['X_Mean']
-    ].copy()
-    descending_points = calculated_points_sorted[
+    )
+    descending_points = select_rows(
+        calculated_points_sorted,
         calculated_points_sorted['Y_Calculated_Mean'] <= calculated_points_sorted['X_Mean']
-    ].copy()
+    )
 
-    num_ascending = len(ascending_points)
-    num_descending = len(descending_points)
+    num_ascending = len(ascending_points['g_num'])
+    num_descending = len(descending_points['g_num'])
 
     half_width = (arrow_width - arrow_gap) / 2
 
-    if num_ascending > 1:
-        ascending_positions = np.linspace(
-            arrow_center_pos - arrow_width/2,
-            arrow_center_pos - arrow_gap/2,
-            num_ascending
-        )
-    elif num_ascending == 1:
-        ascending_positions = [arrow_center_pos - arrow_width/4]
-    else:
-        ascending_positions = []
-
-    if num_descending > 1:
-        descending_positions = np.linspace(
-            arrow_center_pos + arrow_gap/2,
-            arrow_center_pos + arrow_width/2,
-            num_descending
-        )
-    elif num_descending == 1:
-        descending_positions = [arrow_center_pos + arrow_width/4]
-    else:
-        descending_positions = []
+    ascending_positions = arrow_positions(
+        arrow_center_pos - arrow_width/2,
+        arrow_center_pos - arrow_gap/2,
+        arrow_center_pos - arrow_width/4,
+        num_ascending
+    )
+    descending_positions = arrow_positions(
+        arrow_center_pos + arrow_gap/2,
+        arrow_center_pos + arrow_width/2,
+        arrow_center_pos + arrow_width/4,
+        num_descending
+    )
 
-    arrow_min = min(calculated_points_filtered['X_Mean'].min(), calculated_points_filtered['Y_Calculated_Mean'].min())
-    arrow_max = max(calculated_points_filtered['X_Mean'].max(), calculated_points_filtered['Y_Calculated_Mean'].max())
+    arrow_values = np.concatenate([calculated_points_filtered['X_Mean'],
+                                   calculated_points_filtered['Y_Calculated_Mean']])
+    arrow_min, arrow_max = arrow_values.min(), arrow_values.max()
 
     boxplot_min = min(whisker1_min, whisker2_min)
     boxplot_max = max(whisker1_max, whisker2_max)
@@ -305,104 +393,90 @@ def main():
     y_max = overall_max + top_padding
 
     arrows_data = []
-
-    for i, (_, row) in enumerate(ascending_points.iterrows()):
-        x_mean = row['X_Mean']
-        y_mean = row['Y_Calculated_Mean']
-        g_num = row['g_num']
-
-        line_width = 1 + 7 * (g_num - min_g_num) / (max_g_num - min_g_num) if max_g_num != min_g_num else 4
-
-        color_val = (g_num - min_g_num) / (max_g_num - min_g_num) if max_g_num != min_g_num else 0.5
-
-        color = mcolors.to_rgba(plt.cm.Blues(0.3 + 0.7 * color_val))
-
-        color_hex = '#{:02x}{:02x}{:02x}'.format(int(color[0]*255), int(color[1]*255), int(color[2]*255))
-
-        z_val = 10 + int(g_num)
-
-        arrow_x = ascending_positions[i]
-
-        triangle_height = data_range * 0.03
-        triangle_width = 0.007 * line_width
-
-        ax.plot([arrow_x, arrow_x], [x_mean, y_mean],
-                color=color, linewidth=line_width, zorder=z_val)
-
-        triangle = Polygon([
-            (arrow_x - triangle_width/2, y_mean - triangle_height/2),
-            (arrow_x + triangle_width/2, y_mean - triangle_height/2),
-            (arrow_x, y_mean + triangle_height/2)
-        ], closed=True, facecolor=color, edgecolor=color, zorder=z_val)
-        ax.add_patch(triangle)
-
-        if args.show_numbers:
-            mid_y = (x_mean + y_mean) / 2
-            text_x = arrow_x - 0.02
-            ax.text(text_x, mid_y, str(int(g_num)), fontsize=7,
-                    color=color, ha='right', va='center', zorder=z_val + 1)
-
-        arrows_data.append({
-            'group': int(row['Group']) if 'Group' in row else None,
-            'x_position': float(arrow_x),
-            'y_start': float(x_mean),
-            'y_end': float(y_mean),
-            'g_num': int(g_num),
-            'direction': 'up',
-            'color': color_hex,
-            'line_width': float(line_width),
-            'triangle_height': float(triangle_height),
-            'triangle_width': float(triangle_width)
-        })
-
-    for i, (_, row) in enumerate(descending_points.iterrows()):
-        x_mean = row['X_Mean']
-        y_mean = row['Y_Calculated_Mean']
-        g_num = row['g_num']
-
-        line_width = 1 + 7 * (g_num - min_g_num) / (max_g_num - min_g_num) if max_g_num != min_g_num else 4
-
-        color_val = (g_num - min_g_num) / (max_g_num - min_g_num) if max_g_num != min_g_num else 0.5
-
-        color = mcolors.to_rgba(plt.cm.Blues(0.3 + 0.7 * color_val))
-
-        color_hex = '#{:02x}{:02x}{:02x}'.format(int(color[0]*255), int(color[1]*255), int(color[2]*255))
-
-        z_val = 10 + int(g_num)
-
-        arrow_x = descending_positions[i]
-
-        triangle_height = data_range * 0.03
-        triangle_width = 0.007 * line_width
-
-        ax.plot([arrow_x, arrow_x], [x_mean, y_mean],
-                color=color, linewidth=line_width, zorder=z_val)
-
-        triangle = Polygon([
-            (arrow_x - triangle_width/2, y_mean + triangle_height/2),
-            (arrow_x + triangle_width/2, y_mean + triangle_height/2),
-            (arrow_x, y_mean - triangle_height/2)
-        ], closed=True, facecolor=color, edgecolor=color, zorder=z_val)
-        ax.add_patch(triangle)
+    arrow_segments = []
+    arrow_heads = []
+    arrow_colors = []
+    arrow_widths = []
+    arrow_zorders = []
+
+    triangle_height = data_range * 0.03
+
+    for points, arrow_xs, direction, sign, text_dx, text_ha in (
+            (ascending_points, ascending_positions, 'up', 1, -0.02, 'right'),
+            (descending_points, descending_positions, 'down', -1, 0.02, 'left')):
+        g_nums = points['g_num']
+        if len(g_nums) == 0:
+            continue
+
+        x_means = points['X_Mean']
+        y_means = points['Y_Calculated_Mean']
+
+        if max_g_num != min_g_num:
+            line_widths = 1 + 7 * (g_nums - min_g_num) / (max_g_num - min_g_num)
+            color_vals = (g_nums - min_g_num) / (max_g_num - min_g_num)
+        else:
+            line_widths = np.full(len(g_nums), 4.0)
+            color_vals = np.full(len(g_nums), 0.5)
+
+        colors = plt.cm.Blues(0.3 + 0.7 * color_vals)
+        color_hexes = rgb_to_hex(colors)
+
+        z_vals = 10 + g_nums.astype(int)
+
+        triangle_widths = 0.007 * line_widths
+        heads = np.empty((len(g_nums), 3, 2))
+        heads[:, 0, 0] = arrow_xs - triangle_widths/2
+        heads[:, 1, 0] = arrow_xs + triangle_widths/2
+        heads[:, 2, 0] = arrow_xs
+        heads[:, :2, 1] = (y_means - sign * triangle_height/2)[:, None]
+        heads[:, 2, 1] = y_means + sign * triangle_height/2
+
+        arrow_segments.append(np.stack([
+            np.column_stack([arrow_xs, x_means]),
+            np.column_stack([arrow_xs, y_means]),
+        ], axis=1))
+        arrow_heads.append(heads)
+        arrow_colors.append(colors)
+        arrow_widths.append(line_widths)
+        arrow_zorders.append(z_vals)
 
         if args.show_numbers:
-            mid_y = (x_mean + y_mean) / 2
-            text_x = arrow_x + 0.02
-            ax.text(text_x, mid_y, str(int(g_num)), fontsize=7,
-                    color=color, ha='left', va='center', zorder=z_val + 1)
-
-        arrows_data.append({
-            'group': int(row['Group']) if 'Group' in row else None,
-            'x_position': float(arrow_x),
-            'y_start': float(x_mean),
-            'y_end': float(y_mean),
-            'g_num': int(g_num),
-            'direction': 'down',
+            mid_ys = (x_means + y_means) / 2
+            for arrow_x, mid_y, g_num, color, z_val in zip(
+                    arrow_xs, mid_ys, g_nums, colors, z_vals):
+                ax.text(arrow_x + text_dx, mid_y, str(int(g_num)), fontsize=7,
+                        color=color, ha=text_ha, va='center', zorder=z_val + 1)
+
+        groups = (points['Group'].astype(np.int64).tolist() if 'Group' in points
+                  else [None] * len(g_nums))
+        arrows_data.extend({
+            'group': group,
+            'x_position': arrow_x,
+            'y_start': x_mean,
+            'y_end': y_mean,
+            'g_num': g_num,
+            'direction': direction,
             'color': color_hex,
-            'line_width': float(line_width),
+            'line_width': line_width,
             'triangle_height': float(triangle_height),
-            'triangle_width': float(triangle_width)
-        })
+            'triangle_width': triangle_width,
+        } for group, arrow_x, x_mean, y_mean, g_num, color_hex, line_width, triangle_width in zip(
+            groups, arrow_xs.tolist(), x_means.tolist(), y_means.tolist(),
+            g_nums.astype(np.int64).tolist(), color_hexes,
+            line_widths.astype(float).tolist(), triangle_widths.astype(float).tolist()))
+
+    if arrow_segments:
+        # Paint arrows in their old per-arrow zorder (larger g_num on top) within
+        # one collection for the shafts and one for the heads.
+        order = np.argsort(np.concatenate(arrow_zorders), kind='stable')
+        arrow_colors = np.concatenate(arrow_colors)[order]
+        ax.add_collection(LineCollection(
+            np.concatenate(arrow_segments)[order], colors=arrow_colors,
+            linewidths=np.concatenate(arrow_widths)[order],
+            capstyle='projecting', zorder=10))
+        ax.add_collection(PolyCollection(
+            np.concatenate(arrow_heads)[order], closed=True,
+            facecolors=arrow_colors, edgecolors=arrow_colors, zorder=10))
 
     ax.set_ylim(y_min, y_max)
     ax.set_xlim(0, 1)
@@ -436,8 +510,8 @@ def main():
 The technology is currently under patent application. Commercial use is prohibited without a separate license agreement. E-mail: akihi
 ro.ezoe@riken.jp"""
 
-    plt.subplots_adjust(left=0.1, right=0.88, top=0.9, bottom=0.15)
-    plt.figtext(0.5, 0.02, copyright_text, ha='center', fontsize=8, color='black')
+    fig.subplots_adjust(left=0.1, right=0.88, top=0.9, bottom=0.15)
+    fig.text(0.5, 0.02, copyright_text, ha='center', fontsize=8, color='black')
 
     axis_info = {
         'x_min': 0,
@@ -452,24 +526,24 @@ ro.ezoe@riken.jp"""
     if args.format == 'json':
         export_json(output_filename, boxplot_data, arrows_data, stats, axis_info)
     elif args.format == 'html':
-        svg_buffer = io.StringIO()
-        plt.savefig(svg_buffer, format='svg', bbox_inches='tight')
-        svg_content = svg_buffer.getvalue()
-        svg_content = svg_content[svg_content.find('<svg'):]
+        svg_buffer = io.BytesIO()
+        fig.savefig(svg_buffer, format='svg', bbox_inches='tight')
+        _, svg_tag, svg_rest = svg_buffer.getvalue().partition(b'<svg')
+        svg_content = (svg_tag + svg_rest).decode('utf-8')
         export_html(output_filename, svg_content, title)
     elif args.format == 'pdf':
         with PdfPages(output_filename) as pdf:
-            pdf.savefig(fig, dpi=300, bbox_inches='tight')
+            pdf.savefig(fig, bbox_inches='tight')
             d = pdf.infodict()
             d['Title'] = 'X-Y Value Changes with Boxplots'
             d['Author'] = 'Generated by Python'
             d['Subject'] = 'Data Visualization'
             d['Keywords'] = 'boxplot, arrows, data visualization'
-            d['CreationDate'] = pd.Timestamp.now()
+            d['CreationDate'] = datetime.now()
     else:
-        plt.savefig(output_filename, format=args.format, dpi=300 if args.format == 'png' else None, bbox_inches='tight')
+        fig.savefig(output_filename, format=args.format, dpi=300 if args.format == 'png' else None, bbox_inches='tight')
 
-    plt.close()
+    plt.close(fig)
 
     print(f"Output file: '{output_filename}'")
     print(f"\nDebug information:")
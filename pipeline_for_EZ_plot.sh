@@ -29,6 +29,8 @@ Clustering Options (passed to preparation_1.py):
                       'ward' (default), 'complete', 'average', 'single'
   --min_cluster_size N  Minimum cluster size for HDBSCAN (default: 5)
   --min_samples N     Minimum samples for HDBSCAN core points (default: None)
+  --hdbscan_backend B HDBSCAN implementation: 'native' (default) or 'hdbscan'
+                      (requires the optional hdbscan package)
 
 Examples:
   $0 data.txt
@@ -114,6 +116,10 @@ while [ $# -gt 0 ]; do
             CLUSTER_OPTS="$CLUSTER_OPTS --min_samples $2"
             shift 2
             ;;
+        --hdbscan_backend)
+            CLUSTER_OPTS="$CLUSTER_OPTS --hdbscan_backend $2"
+            shift 2
+            ;;
         *)
             echo "Unknown option: $1"
             exit 1
@@ -146,18 +152,24 @@ fi
 echo "Step 2: Running preparation_2.py..."
 python preparation_2.py
 
-echo "Step 3: Running Python visualization scripts..."
-echo "  3a: Running slopegraph.py..."
-python slopegraph.py --format "$OUTPUT_FORMAT" $PREFIX_OPT $NO_OUTLIERS $LOG2 $SHOW_NUMBERS
-
-echo "  3b: Running clustered_line_plot.py..."
-python clustered_line_plot.py --format "$OUTPUT_FORMAT" $PREFIX_OPT $NO_OUTLIERS $LOG2 $SHOW_NUMBERS
-
-echo "  3c: Running parallel_arrow_plot.py..."
-python parallel_arrow_plot.py --format "$OUTPUT_FORMAT" $PREFIX_OPT $NO_OUTLIERS $LOG2 $SHOW_NUMBERS
+# The four plots only read the preparation outputs, so render them in parallel
+# processes (one figure per process) and wait for all of them.
+echo "Step 3: Running Python visualization scripts in parallel..."
+PLOT_PIDS=""
+for script in slopegraph.py clustered_line_plot.py parallel_arrow_plot.py trapezoid_plot.py; do
+    echo "  Starting $script..."
+    python "$script" --format "$OUTPUT_FORMAT" $PREFIX_OPT $NO_OUTLIERS $LOG2 $SHOW_NUMBERS &
+    PLOT_PIDS="$PLOT_PIDS $!"
+done
 
-echo "  3d: Running trapezoid_plot.py..."
-python trapezoid_plot.py --format "$OUTPUT_FORMAT" $PREFIX_OPT $NO_OUTLIERS $LOG2 $SHOW_NUMBERS
+PLOT_FAILED=0
+for pid in $PLOT_PIDS; do
+    wait "$pid" || PLOT_FAILED=1
+done
+if [ "$PLOT_FAILED" -ne 0 ]; then
+    echo "Error: one or more visualization scripts failed"
+    exit 1
+fi
 
 echo ""
 echo "Pipeline execution completed successfully"
@@ -10,15 +10,28 @@ import sys
 import os
 import argparse
 import re
+import math
 import numpy as np
 from scipy.cluster.hierarchy import linkage, fcluster
-from scipy.spatial.distance import pdist, squareform
+from scipy.spatial.distance import pdist
+
+# Optional: with Numba installed, the HDBSCAN loops below are compiled (cached
+# on disk after the first run) and the MST skips the pdist buffer.
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+try:
+    import hdbscan as hdbscan_lib
+except ImportError:
+    hdbscan_lib = None
 
 
 def apply_log2_transform(data, min_value=1e-10):
     data = np.array(data, dtype=float)
-    data = np.where(data <= 0, min_value, data)
-    return np.log2(data), 0
+    np.copyto(data, min_value, where=data <= 0)
+    return np.log2(data, out=data), 0
 
 
 def filter_non_positive_for_log2(data):
@@ -36,44 +49,52 @@ def detect_delimiter(line):
         return None
 
 
-def is_header_line(line, delimiter):
-    if delimiter:
-        parts = [p.strip() for p in line.split(delimiter)]
-    else:
-        parts = line.split()
+# A field float() accepts, minus exotic forms like digit underscores.
+NUMBER = r'[-+]?(?:(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|inf(?:inity)?|nan)'
 
-    if len(parts) < 2:
-        return False
+# First two fields numeric, keyed by the delimiter detect_delimiter returns.
+PAIR_PATTERNS = {
+    ',': re.compile(rf'\s*({NUMBER})\s*,\s*({NUMBER})\s*(?:,|$)', re.IGNORECASE),
+    '\t': re.compile(rf'\s*({NUMBER})\s*\t\s*({NUMBER})\s*(?:\t|$)', re.IGNORECASE),
+    None: re.compile(rf'\s*({NUMBER})\s+({NUMBER})(?:\s|$)', re.IGNORECASE),
+}
 
-    try:
-        float(parts[0])
-        float(parts[1])
+
+def is_header_line(line, delimiter):
+    if PAIR_PATTERNS[delimiter].match(line):
         return False
-    except ValueError:
-        return True
+    parts = line.split(delimiter) if delimiter else line.split()
+    return len(parts) >= 2
 
 
 def parse_line(line, delimiter):
-    if delimiter:
-        parts = [p.strip() for p in line.split(delimiter)]
-    else:
-        parts = line.split()
-
-    if len(parts) < 2:
+    m = PAIR_PATTERNS[delimiter].match(line)
+    if m is None:
         return None
+    return (float(m[1]), float(m[2]))
 
-    try:
-        x = float(parts[0])
-        y = float(parts[1])
-        return (x, y)
-    except ValueError:
-        return None
+
+def parse_lines(input_file, delimiter, skip_lines):
+    data = []
+
+    with open(input_file, 'r') as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if line_num <= skip_lines or not line:
+                continue
+
+            result = parse_line(line, delimiter)
+            if result:
+                data.append(list(result))
+            else:
+                print(f"Warning: Could not parse line {line_num}: {line[:50]}{'...' if len(line) > 50 else ''}")
+
+    return np.array(data) if data else np.array([])
 
 
 def load_data(input_file):
-    data = []
     delimiter = None
-    header_skipped = False
+    skip_lines = 0
 
     with open(input_file, 'r') as f:
         for line_num, line in enumerate(f, 1):
@@ -81,78 +102,69 @@ def load_data(input_file):
             if not line:
                 continue
 
-            if delimiter is None and line_num == 1:
+            if line_num == 1:
                 delimiter = detect_delimiter(line)
                 if delimiter:
                     print(f"Detected delimiter: {'comma' if delimiter == ',' else 'tab'}")
                 else:
                     print("Detected delimiter: whitespace")
 
-            if not header_skipped:
-                if is_header_line(line, delimiter):
-                    print(f"Skipping header line: {line[:50]}{'...' if len(line) > 50 else ''}")
-                    header_skipped = True
-                    continue
-                header_skipped = True
+            if is_header_line(line, delimiter):
+                print(f"Skipping header line: {line[:50]}{'...' if len(line) > 50 else ''}")
+                skip_lines = line_num
+            break
+        else:
+            return np.array([])
 
-            result = parse_line(line, delimiter)
-            if result:
-                data.append(list(result))
-            else:
-                print(f"Warning: Could not parse line {line_num}: {line[:50]}{'...' if len(line) > 50 else ''}")
+    try:
+        data = np.loadtxt(input_file, delimiter=delimiter, skiprows=skip_lines,
+                          usecols=(0, 1), comments=None, ndmin=2)
+    except ValueError:
+        # Some rows are malformed; the per-line parser skips and reports them.
+        return parse_lines(input_file, delimiter, skip_lines)
 
-    return np.array(data) if data else np.array([])
+    return data if len(data) else np.array([])
 
 
 def split_by_direction(data):
-    pos_indices = []
-    neg_indices = []
-
-    for i, (x, y) in enumerate(data):
-        diff = y - x
-        if diff >= 0:
-            pos_indices.append(i)
-        else:
-            neg_indices.append(i)
+    mask = data[:, 1] - data[:, 0] >= 0
+    pos_indices = np.nonzero(mask)[0]
+    neg_indices = np.nonzero(~mask)[0]
 
     return pos_indices, neg_indices
 
 
-def find_optimal_k_elbow(data, max_k=7):
+# scipy runs these methods in O(n^2) (nearest-neighbour chain, or the MST
+# for single); centroid/median fall back to the generic O(n^3) algorithm.
+NN_CHAIN_METHODS = ('ward', 'complete', 'average', 'weighted', 'single')
+NN_CHAIN_REQUIRED_N = 2000
+
+
+def within_cluster_ss(data, clusters):
+    """Total within-cluster sum of squares for integer cluster labels."""
+    counts = np.bincount(clusters)
+    sums = np.column_stack([np.bincount(clusters, weights=col) for col in data.T])
+    centroids = sums / np.maximum(counts, 1)[:, None]
+    return np.sum((data - centroids[clusters]) ** 2)
+
+
+def find_optimal_k_elbow(data, Z, max_k=7):
     n = len(data)
     if n <= 3:
         return 1
 
     max_k = min(max_k, n)
 
-    Z = linkage(data, method='ward')
-
-    wss_list = []
-    for k in range(1, max_k + 1):
-        if k == 1:
-            centroid = np.mean(data, axis=0)
-            wss = np.sum((data - centroid) ** 2)
-        else:
-            clusters = fcluster(Z, t=k, criterion='maxclust')
-            wss = 0
-            for cluster_id in range(1, k + 1):
-                cluster_points = data[clusters == cluster_id]
-                if len(cluster_points) > 0:
-                    centroid = np.mean(cluster_points, axis=0)
-                    wss += np.sum((cluster_points - centroid) ** 2)
-        wss_list.append(wss)
+    wss_list = [np.sum((data - np.mean(data, axis=0)) ** 2)]
+    for k in range(2, max_k + 1):
+        clusters = fcluster(Z, t=k, criterion='maxclust')
+        wss_list.append(within_cluster_ss(data, clusters))
 
     if len(wss_list) < 3:
         return min(2, n)
 
-    angles = []
-    for i in range(1, len(wss_list) - 1):
-        angle1 = np.arctan2(wss_list[i-1] - wss_list[i], 1)
-        angle2 = np.arctan2(wss_list[i] - wss_list[i+1], 1)
-        angles.append(abs(angle1 - angle2))
-
-    if not angles:
-        return 2
+    slopes = np.arctan2(-np.diff(wss_list), 1)
+    angles = np.abs(np.diff(slopes))
 
     optimal_k = np.argmax(angles) + 2
     return optimal_k
@@ -165,230 +177,302 @@ def hierarchical_clustering(data, max_k=7, method='ward'):
     if n == 1:
         return np.array([0]), 1
 
-    optimal_k = find_optimal_k_elbow(data, max_k)
+    if n > NN_CHAIN_REQUIRED_N and method not in NN_CHAIN_METHODS:
+        raise ValueError(f"Linkage '{method}' is O(n^3) in scipy; use one of "
+                         f"{', '.join(NN_CHAIN_METHODS)} for more than {NN_CHAIN_REQUIRED_N} points")
 
-    Z = linkage(data, method=method)
+    # One condensed distance vector feeds every linkage call below.
+    y = pdist(data)
+    # The elbow is always judged on the ward tree; reuse it for ward clustering.
+    ward_Z = linkage(y, method='ward')
+    optimal_k = find_optimal_k_elbow(data, ward_Z, max_k)
+
+    Z = ward_Z if method == 'ward' else linkage(y, method=method)
 
     clusters = fcluster(Z, t=optimal_k, criterion='maxclust') - 1
 
     return clusters, optimal_k
 
 
-def compute_core_distances(distance_matrix, min_samples):
-    n = distance_matrix.shape[0]
-    core_distances = np.zeros(n)
+def condensed_rows(condensed, n, rows):
+    """Expand full distance-matrix rows from a condensed pdist vector."""
+    out = np.zeros((len(rows), n), dtype=condensed.dtype)
+    if len(rows) == 0:
+        return out
+    # Entry (j, i) with j < i sits at lower_base[j] + i in the condensed
+    # vector; the entries (i, j > i) are one contiguous run starting at row i's
+    # offset. Only 1-D index vectors are built, never a (rows, n) grid.
+    j = np.arange(rows.max())
+    lower_base = n * j - j * (j + 3) // 2 - 1
+    for r, i in enumerate(rows.tolist()):
+        start = n * i - i * (i + 1) // 2
+        out[r, i + 1:] = condensed[start:start + n - i - 1]
+        out[r, :i] = condensed[lower_base[:i] + i]
+    return out
+
+
+def compute_core_distances(condensed, n, min_samples, block_size=1024):
+    # Work through the rows in blocks so only a (block_size, n) slice of the
+    # square distance matrix is ever expanded at once.
+    k = min(min_samples, n - 1)
+    core_distances = np.empty(n, dtype=condensed.dtype)
+    for start in range(0, n, block_size):
+        rows = np.arange(start, min(start + block_size, n))
+        block = condensed_rows(condensed, n, rows)
+        core_distances[rows] = np.partition(block, k, axis=1)[:, k]
+    return core_distances
 
-    for i in range(n):
-        sorted_distances = np.sort(distance_matrix[i])
-        if min_samples < len(sorted_distances):
-            core_distances[i] = sorted_distances[min_samples]
-        else:
-            core_distances[i] = sorted_distances[-1]
 
+def core_distances_loop(data, k):
+    # One thread per row: rebuild the row's distances in float32, exactly as
+    # pdist(...).astype(np.float32) would, and select the k-th smallest.
+    n, dim = data.shape
+    core_distances = np.empty(n, dtype=np.float32)
+    for i in prange(n):
+        row = np.empty(n, dtype=np.float32)
+        for j in range(n):
+            s = 0.0
+            for c in range(dim):
+                t = data[i, c] - data[j, c]
+                s += t * t
+            row[j] = math.sqrt(s)
+        core_distances[i] = np.partition(row, k)[k]
     return core_distances
 
 
-def compute_mutual_reachability_distance(distance_matrix, core_distances):
-    n = distance_matrix.shape[0]
-    mutual_reach = np.zeros((n, n))
-
-    for i in range(n):
-        for j in range(n):
-            mutual_reach[i, j] = max(core_distances[i], core_distances[j], distance_matrix[i, j])
+def prim_points_loop(data, core_distances):
+    # Prim over the implicit mutual reachability graph; each step relaxes
+    # the frontier in parallel, computing distances from the coordinates.
+    n, dim = data.shape
+    in_tree = np.zeros(n, dtype=np.bool_)
+    min_dist = np.full(n, np.inf)
+    parent = np.full(n, -1, dtype=np.int64)
+    edges = np.empty((n - 1, 3))
+    u = 0
+    for k in range(n - 1):
+        in_tree[u] = True
+        for v in prange(n):
+            if not in_tree[v]:
+                s = 0.0
+                for c in range(dim):
+                    t = data[u, c] - data[v, c]
+                    s += t * t
+                d = max(np.float32(math.sqrt(s)), core_distances[u], core_distances[v])
+                if d < min_dist[v]:
+                    min_dist[v] = d
+                    parent[v] = u
+        nxt = -1
+        for v in range(n):
+            if not in_tree[v] and (nxt == -1 or min_dist[v] < min_dist[nxt]):
+                nxt = v
+        edges[k, 0] = parent[nxt]
+        edges[k, 1] = nxt
+        edges[k, 2] = min_dist[nxt]
+        u = nxt
+    return edges
 
-    return mutual_reach
 
+if njit is not None:
+    parallel_core_distances = njit(parallel=True, cache=True)(core_distances_loop)
+    parallel_prim = njit(parallel=True, cache=True)(prim_points_loop)
+else:
+    parallel_core_distances = None
+    parallel_prim = None
 
-def minimum_spanning_tree_prim(distance_matrix):
-    n = distance_matrix.shape[0]
 
+def minimum_spanning_tree(condensed, core_distances, n):
+    # Prim over the condensed vector, expanding one row per step and
+    # relaxing the frontier with NumPy masks.
     in_tree = np.zeros(n, dtype=bool)
     min_dist = np.full(n, np.inf)
-    min_dist[0] = 0
     parent = np.full(n, -1, dtype=int)
-
-    edges = []
-
-    for _ in range(n):
-        u = -1
-        for i in range(n):
-            if not in_tree[i] and (u == -1 or min_dist[i] < min_dist[u]):
-                u = i
-
+    edges = np.empty((n - 1, 3))
+    u = 0
+    for k in range(n - 1):
         in_tree[u] = True
-
-        if parent[u] != -1:
-            edges.append((parent[u], u, min_dist[u]))
-
-        for v in range(n):
-            if not in_tree[v] and distance_matrix[u, v] < min_dist[v]:
-                min_dist[v] = distance_matrix[u, v]
-                parent[v] = u
-
+        row = condensed_rows(condensed, n, np.array([u]))[0]
+        row = np.maximum(row, np.maximum(core_distances[u], core_distances))
+        better = ~in_tree & (row < min_dist)
+        min_dist[better] = row[better]
+        parent[better] = u
+        u = np.where(in_tree, np.inf, min_dist).argmin()
+        edges[k] = (parent[u], u, min_dist[u])
     return edges
 
 
-class UnionFind:
-    def __init__(self, n):
-        self.parent = list(range(n))
-        self.rank = [0] * n
-        self.size = [1] * n
+def uf_find(parent, x):
+    # Path splitting: point every node on the walk at its grandparent.
+    while parent[x] != x:
+        parent[x], x = parent[parent[x]], parent[x]
+    return x
 
-    def find(self, x):
-        if self.parent[x] != x:
-            self.parent[x] = self.find(self.parent[x])
-        return self.parent[x]
 
-    def union(self, x, y):
-        px, py = self.find(x), self.find(y)
-        if px == py:
-            return False
-        if self.rank[px] < self.rank[py]:
-            px, py = py, px
-        self.parent[py] = px
-        self.size[px] += self.size[py]
-        if self.rank[px] == self.rank[py]:
-            self.rank[px] += 1
-        return True
+def uf_union(parent, rank, size, x, y):
+    """Union two roots by rank and return the surviving root."""
+    if rank[x] < rank[y]:
+        x, y = y, x
+    parent[y] = x
+    size[x] += size[y]
+    if rank[x] == rank[y]:
+        rank[x] += 1
+    return x
 
-    def get_size(self, x):
-        return self.size[self.find(x)]
 
+if njit is not None:
+    uf_find = njit(cache=True)(uf_find)
+    uf_union = njit(cache=True)(uf_union)
 
-def build_condensed_tree(mst_edges, n_points, min_cluster_size):
-    sorted_edges = sorted(mst_edges, key=lambda x: x[2])
-
-    uf = UnionFind(n_points)
 
-    cluster_labels = np.arange(n_points)
+def condense_edges(edges, parent, rank, size, cluster_labels,
+                   tree, cluster_sizes, cluster_birth, n_points):
+    """Merge sorted MST edges into the condensed tree; return rows written."""
     next_cluster_id = n_points
-
-    tree = []
-    cluster_sizes = {i: 1 for i in range(n_points)}
-    cluster_birth = {i: 0.0 for i in range(n_points)}
-
-    for u, v, dist in sorted_edges:
-        cu, cv = uf.find(u), uf.find(v)
-
+    k = 0
+    for i in range(edges.shape[0]):
+        cu = uf_find(parent, int(edges[i, 0]))
+        cv = uf_find(parent, int(edges[i, 1]))
         if cu != cv:
-            size_u = uf.get_size(u)
-            size_v = uf.get_size(v)
-
+            dist = edges[i, 2]
             lambda_val = 1.0 / dist if dist > 0 else np.inf
-
             new_cluster = next_cluster_id
             next_cluster_id += 1
-
-            tree.append({
-                'parent': new_cluster,
-                'child': cluster_labels[cu],
-                'child_size': size_u,
-                'lambda_val': lambda_val
-            })
-            tree.append({
-                'parent': new_cluster,
-                'child': cluster_labels[cv],
-                'child_size': size_v,
-                'lambda_val': lambda_val
-            })
-
-            cluster_sizes[new_cluster] = size_u + size_v
+            tree[k, 0] = new_cluster
+            tree[k, 1] = cluster_labels[cu]
+            tree[k, 2] = size[cu]
+            tree[k, 3] = lambda_val
+            tree[k + 1, 0] = new_cluster
+            tree[k + 1, 1] = cluster_labels[cv]
+            tree[k + 1, 2] = size[cv]
+            tree[k + 1, 3] = lambda_val
+            k += 2
+            cluster_sizes[new_cluster] = size[cu] + size[cv]
             cluster_birth[new_cluster] = lambda_val
-
-            uf.union(u, v)
-            root = uf.find(u)
+            root = uf_union(parent, rank, size, cu, cv)
             cluster_labels[root] = new_cluster
+    return k
 
-    n_clusters = next_cluster_id - n_points
-
-    return tree, cluster_sizes, cluster_birth, n_clusters
-
-
-def extract_clusters_eom(tree, cluster_sizes, cluster_birth, n_clusters, n_points, min_cluster_size):
-    if not tree:
-        return np.zeros(n_points, dtype=int)
-
-    all_clusters = set()
-    cluster_children = {}
-    cluster_lambda_max = {}
-
-    for entry in tree:
-        parent = entry['parent']
-        child = entry['child']
-        lambda_val = entry['lambda_val']
 
-        all_clusters.add(parent)
-        all_clusters.add(child)
+if njit is not None:
+    condense_edges = njit(cache=True)(condense_edges)
 
-        if parent not in cluster_children:
-            cluster_children[parent] = []
-        cluster_children[parent].append(child)
 
-        if child not in cluster_lambda_max:
-            cluster_lambda_max[child] = lambda_val
-        else:
-            cluster_lambda_max[child] = max(cluster_lambda_max[child], lambda_val)
-
-    cluster_stability = {}
-    for cluster in all_clusters:
-        if cluster < n_points:
-            cluster_stability[cluster] = 0
+def build_condensed_tree(mst_edges, n_points, min_cluster_size):
+    edges = np.asarray(mst_edges, dtype=np.float64).reshape(-1, 3)
+    edges = edges[np.argsort(edges[:, 2], kind='stable')]
+
+    parent = np.arange(n_points, dtype=np.int32)
+    rank = np.zeros(n_points, dtype=np.uint8)
+    size = np.ones(n_points, dtype=np.int64)
+    cluster_labels = np.arange(n_points, dtype=np.int64)
+
+    tree = np.empty((2 * (n_points - 1), 4))
+    cluster_sizes = np.ones(2 * n_points, dtype=np.int64)
+    cluster_birth = np.zeros(2 * n_points)
+
+    k = condense_edges(edges, parent, rank, size, cluster_labels,
+                       tree, cluster_sizes, cluster_birth, n_points)
+    n_clusters = k // 2
+
+    return tree[:k], cluster_sizes, cluster_birth, n_clusters
+
+
+def select_eom_clusters(children_ptr, children_idx, stability, sizes,
+                        n_points, root, min_cluster_size):
+    """Excess-of-mass selection as one ascending pass over cluster ids."""
+    # Children always have smaller ids than their parent, so ascending id
+    # order is a post-order walk of the condensed tree.
+    subtree = stability.copy()
+    selected = np.zeros(sizes.shape[0], dtype=np.bool_)
+    for c in range(n_points, root + 1):
+        lo, hi = children_ptr[c], children_ptr[c + 1]
+        if lo == hi:
+            continue
+        children_stab = 0.0
+        for j in range(lo, hi):
+            children_stab += subtree[children_idx[j]]
+        if stability[c] > children_stab:
+            for j in range(lo, hi):
+                selected[children_idx[j]] = False
+            if sizes[c] >= min_cluster_size:
+                selected[c] = True
         else:
-            birth = cluster_birth.get(cluster, 0)
-            death = cluster_lambda_max.get(cluster, birth)
-            size = cluster_sizes.get(cluster, 0)
-            cluster_stability[cluster] = (death - birth) * size
+            subtree[c] = children_stab
+    return selected
 
-    selected_clusters = set()
 
-    def select_clusters(cluster):
-        children = cluster_children.get(cluster, [])
+def nearest_selected_ancestor(children_ptr, children_idx, selected, n_points, root):
+    """Map each point to its lowest selected ancestor, or -1 if none."""
+    owner = np.full(root + 1, -1, dtype=np.int64)
+    for c in range(root, n_points - 1, -1):
+        o = c if selected[c] else owner[c]
+        for j in range(children_ptr[c], children_ptr[c + 1]):
+            owner[children_idx[j]] = o
+    return owner[:n_points]
 
-        if not children:
-            return cluster_stability.get(cluster, 0)
 
-        children_stability = sum(select_clusters(c) for c in children)
-        own_stability = cluster_stability.get(cluster, 0)
+if njit is not None:
+    select_eom_clusters = njit(cache=True)(select_eom_clusters)
+    nearest_selected_ancestor = njit(cache=True)(nearest_selected_ancestor)
 
-        if own_stability > children_stability:
-            for c in children:
-                selected_clusters.discard(c)
-            if cluster_sizes.get(cluster, 0) >= min_cluster_size:
-                selected_clusters.add(cluster)
-            return own_stability
-        else:
-            return children_stability
 
-    root_cluster = max(all_clusters)
-    select_clusters(root_cluster)
+def extract_clusters_eom(tree, cluster_sizes, cluster_birth, n_clusters, n_points, min_cluster_size):
+    if len(tree) == 0:
+        return np.zeros(n_points, dtype=int)
 
-    if not selected_clusters:
+    parent_ids = tree[:, 0].astype(np.int64)
+    child_ids = tree[:, 1].astype(np.int64)
+    root = int(parent_ids.max())
+
+    order = np.argsort(parent_ids, kind='stable')
+    children_idx = child_ids[order]
+    children_ptr = np.searchsorted(parent_ids[order], np.arange(root + 2))
+
+    # Every cluster is merged away exactly once, so its death lambda is the
+    # lambda of its single row as a child; the root keeps death == birth.
+    cluster_death = cluster_birth.copy()
+    cluster_death[child_ids] = tree[:, 3]
+    with np.errstate(invalid='ignore'):
+        cluster_stability = (cluster_death - cluster_birth) * cluster_sizes
+    cluster_stability[:n_points] = 0
+
+    selected = select_eom_clusters(children_ptr, children_idx, cluster_stability,
+                                  cluster_sizes, n_points, root, min_cluster_size)
+    if not selected.any():
         return np.zeros(n_points, dtype=int)
 
-    labels = np.full(n_points, -1, dtype=int)
+    # Selected clusters are numbered in ascending id order and a point takes
+    # the label of the smallest selected cluster containing it.
+    owner = nearest_selected_ancestor(children_ptr, children_idx, selected, n_points, root)
+    cluster_index = np.cumsum(selected) - 1
+    labels = np.where(owner >= 0, cluster_index[owner], 0)
 
-    def get_points_in_cluster(cluster):
-        if cluster < n_points:
-            return {cluster}
+    return labels
 
-        points = set()
-        children = cluster_children.get(cluster, [])
-        for child in children:
-            points.update(get_points_in_cluster(child))
-        return points
 
-    for cluster_idx, cluster in enumerate(sorted(selected_clusters)):
-        points = get_points_in_cluster(cluster)
-        for p in points:
-            if labels[p] == -1:
-                labels[p] = cluster_idx
+def native_hdbscan_labels(data, min_cluster_size, min_samples):
+    n = len(data)
 
-    labels[labels == -1] = 0
+    # Distances only feed comparisons and the MST, so float32 is ample and
+    # halves the bytes every O(n^2) pass moves.
+    if parallel_prim is not None:
+        points = np.ascontiguousarray(data, dtype=np.float64)
+        core_distances = parallel_core_distances(points, min_samples)
+        mst_edges = parallel_prim(points, core_distances)
+    else:
+        condensed = pdist(data, metric='euclidean').astype(np.float32)
+        core_distances = compute_core_distances(condensed, n, min_samples)
+        mst_edges = minimum_spanning_tree(condensed, core_distances, n)
 
-    return labels
+    tree, cluster_sizes, cluster_birth, n_clusters = build_condensed_tree(
+        mst_edges, n, min_cluster_size
+    )
+
+    return extract_clusters_eom(
+        tree, cluster_sizes, cluster_birth, n_clusters, n, min_cluster_size
+    )
 
 
-def hdbscan_clustering(data, min_cluster_size=5, min_samples=None):
+def hdbscan_clustering(data, min_cluster_size=5, min_samples=None, backend='native'):
     n = len(data)
     if n == 0:
         return np.array([]), 0
@@ -403,21 +487,18 @@ def hdbscan_clustering(data, min_cluster_size=5, min_samples=None):
     min_cluster_size = max(2, min(min_cluster_size, n // 2))
     min_samples = max(1, min(min_samples, n - 1))
 
-    distances = squareform(pdist(data, metric='euclidean'))
-
-    core_distances = compute_core_distances(distances, min_samples)
-
-    mutual_reach = compute_mutual_reachability_distance(distances, core_distances)
-
-    mst_edges = minimum_spanning_tree_prim(mutual_reach)
-
-    tree, cluster_sizes, cluster_birth, n_clusters = build_condensed_tree(
-        mst_edges, n, min_cluster_size
-    )
-
-    labels = extract_clusters_eom(
-        tree, cluster_sizes, cluster_birth, n_clusters, n, min_cluster_size
-    )
+    if backend == 'hdbscan':
+        if hdbscan_lib is None:
+            raise ImportError("--hdbscan_backend hdbscan requires the hdbscan package "
+                              "(pip install hdbscan)")
+        # The library counts each point among its own min_samples neighbours;
+        # +1 gives the same core distance as the native implementation. Tree
+        # condensing and cluster selection still follow the library's rules,
+        # so labels can differ from the native backend.
+        labels = hdbscan_lib.HDBSCAN(min_cluster_size=min_cluster_size,
+                                      min_samples=min_samples + 1).fit_predict(data)
+    else:
+        labels = native_hdbscan_labels(data, min_cluster_size, min_samples)
 
     unique_labels = np.unique(labels[labels >= 0])
     n_found = len(unique_labels)
@@ -425,8 +506,9 @@ def hdbscan_clustering(data, min_cluster_size=5, min_samples=None):
     if n_found == 0:
         return np.zeros(n, dtype=int), 1
 
-    label_map = {old: new for new, old in enumerate(unique_labels)}
-    labels = np.array([label_map.get(l, 0) for l in labels])
+    remapped = np.searchsorted(unique_labels, labels)
+    remapped[labels < 0] = 0
+    labels = remapped
 
     return labels, n_found
 
@@ -452,11 +534,15 @@ Examples:
                         help='Clustering method (default: hierarchical)')
     parser.add_argument('--linkage', '-l', choices=['ward', 'complete', 'average', 'single'],
                         default='ward',
-                        help='Linkage method for hierarchical clustering (default: ward)')
+                        help='Linkage method for hierarchical clustering (default: ward); '
+                             'all run in O(n^2) via scipy\'s nearest-neighbour chain / MST')
     parser.add_argument('--min_cluster_size', type=int, default=5,
                         help='Minimum cluster size for HDBSCAN (default: 5)')
     parser.add_argument('--min_samples', type=int, default=None,
                         help='Minimum samples for HDBSCAN core points (default: None)')
+    parser.add_argument('--hdbscan_backend', choices=['native', 'hdbscan'], default='native',
+                        help='HDBSCAN implementation: the built-in one (default) or the '
+                             'optional hdbscan package')
     parser.add_argument('--output_dir', '-o', default='output_EZ',
                         help='Output directory (default: output_EZ)')
     parser.add_argument('--log2', action='store_true',
@@ -492,8 +578,8 @@ Examples:
     print(f"Clustering method: {args.method}")
 
     pos_indices, neg_indices = split_by_direction(data)
-    pos_data = data[pos_indices] if pos_indices else np.array([])
-    neg_data = data[neg_indices] if neg_indices else np.array([])
+    pos_data = data[pos_indices]
+    neg_data = data[neg_indices]
 
     print(f"Positive changes (Y >= X): {len(pos_indices)} points")
     print(f"Negative changes (Y < X): {len(neg_indices)} points")
@@ -512,11 +598,11 @@ Examples:
             pos_clusters, pos_k = hdbscan_clustering(
                 pos_data,
                 min_cluster_size=args.min_cluster_size,
-                min_samples=args.min_samples
+                min_samples=args.min_samples,
+                backend=args.hdbscan_backend
             )
 
-        for i, idx in enumerate(pos_indices):
-            all_clusters[idx] = pos_clusters[i]
+        all_clusters[pos_indices] = pos_clusters
 
         cluster_offset = pos_clusters.max() + 1 if len(pos_clusters) > 0 else 0
         print(f"Positive group: {pos_k} clusters")
@@ -532,18 +618,18 @@ Examples:
             neg_clusters, neg_k = hdbscan_clustering(
                 neg_data,
                 min_cluster_size=args.min_cluster_size,
-                min_samples=args.min_samples
+                min_samples=args.min_samples,
+                backend=args.hdbscan_backend
             )
 
-        for i, idx in enumerate(neg_indices):
-            all_clusters[idx] = neg_clusters[i] + cluster_offset
+        all_clusters[neg_indices] = neg_clusters + cluster_offset
 
         print(f"Negative group: {neg_k} clusters")
 
+    rows = [f"{x} {y} {c}\n" for x, y, c in
+            zip(data[:, 0].tolist(), data[:, 1].tolist(), all_clusters.tolist())]
     with open(output_file, 'w') as f:
-        f.write("X Y Cluster\n")
-        for i, (x, y) in enumerate(data):
-            f.write(f"{x} {y} {all_clusters[i]}\n")
+        f.write("X Y Cluster\n" + "".join(rows))
 
     print(f"Results saved to {output_file}")
 
@@ -7,6 +7,8 @@
 
 import sys
 import os
+import numpy as np
+import pandas as pd
 
 def calculate_quartile_indices(n):
     if n == 0:
@@ -23,9 +25,11 @@ def calculate_stats(values):
     if n == 0:
         return 0, 0, 0, 0, 0
 
-    sorted_values = sorted(values)
+    sorted_values = np.sort(np.asarray(values, dtype=np.float64))
 
-    mean = sum(sorted_values) / n
+    # Accumulated left to right in sorted order; ndarray.mean sums pairwise
+    # and can change the last bit.
+    mean = sum(sorted_values.tolist()) / n
 
     q1_idx, q2_idx, q3_idx = calculate_quartile_indices(n)
 
@@ -40,62 +44,46 @@ def main():
     stats_file = 'output_EZ/group_statistics.txt'
     calc_file = 'output_EZ/calculated_points.txt'
 
-    data = []
     try:
-        with open(input_file, 'r') as f:
-            header = f.readline()
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                parts = line.split()
-                if len(parts) >= 3:
-                    data.append([float(parts[0]), float(parts[1]), int(parts[2])])
+        df = pd.read_csv(input_file, sep=r'\s+', engine='c',
+                         dtype={'X': np.float64, 'Y': np.float64, 'Cluster': np.int64})
     except FileNotFoundError:
         print(f"Error: Cannot open file: {input_file}")
         sys.exit(1)
 
-    groups = {}
-    for row in data:
-        cluster = row[2]
-        if cluster not in groups:
-            groups[cluster] = []
-        x_val = row[0]
-        y_val = row[1]
-        diff = y_val - x_val
-        groups[cluster].append([x_val, y_val, diff])
+    df['diff'] = df['Y'] - df['X']
 
     stats_results = {}
 
-    for cluster in sorted(groups.keys()):
-        group_data = groups[cluster]
-        x_values = [p[0] for p in group_data]
-        y_values = [p[1] for p in group_data]
-        diff_values = [p[2] for p in group_data]
+    for cluster, group in df.groupby('Cluster', sort=True):
+        cluster = int(cluster)
+        x_values = group['X'].to_numpy()
+        y_values = group['Y'].to_numpy()
+        diff_values = group['diff'].to_numpy()
 
-        m = len(group_data)
+        m = len(group)
 
         x_mean, x_q1, x_q2, x_q3, _ = calculate_stats(x_values)
         y_mean, y_q1, y_q2, y_q3, _ = calculate_stats(y_values)
 
-        sorted_by_x = sorted(group_data, key=lambda item: item[0], reverse=True)
+        sorted_by_x = np.sort(x_values)[::-1]
 
-        sorted_by_diff = sorted(group_data, key=lambda item: item[2], reverse=True)
+        sorted_by_diff = np.sort(diff_values)[::-1]
 
         q1_idx, q2_idx, q3_idx = calculate_quartile_indices(m)
 
         if q2_idx is not None:
-            q2_start = sorted_by_x[q2_idx][0]
+            q2_start = sorted_by_x[q2_idx]
 
-            q2_diff = sorted_by_diff[q2_idx][2]
+            q2_diff = sorted_by_diff[q2_idx]
 
             calc_y_q2 = q2_start + q2_diff
 
-            q1_start = sorted_by_x[q1_idx][0]
-            q1_diff = sorted_by_diff[q1_idx][2]
+            q1_start = sorted_by_x[q1_idx]
+            q1_diff = sorted_by_diff[q1_idx]
 
-            q3_start = sorted_by_x[q3_idx][0]
-            q3_diff = sorted_by_diff[q3_idx][2]
+            q3_start = sorted_by_x[q3_idx]
+            q3_diff = sorted_by_diff[q3_idx]
         else:
             q2_start = x_q2
             q2_diff = y_q2 - x_q2
@@ -128,28 +116,32 @@ def main():
             }
         }
 
+    lines = []
+    for cluster in sorted(stats_results.keys()):
+        s = stats_results[cluster]
+        lines.append(f"Statistics for Group {cluster}:\n")
+        lines.append(f"X: Mean={s['x']['mean']:.4f}, Q1={s['x']['q1']:.4f}, Q2={s['x']['q2']:.4f}, Q3={s['x']['q3']:.4f}\n")
+        lines.append(f"Y: Mean={s['y']['mean']:.4f}, Q1={s['y']['q1']:.4f}, Q2={s['y']['q2']:.4f}, Q3={s['y']['q3']:.4f}\n")
+        lines.append(f"Diff: Mean={s['diff']['mean']:.4f}, Q1={s['diff']['q1']:.4f}, Q2={s['diff']['q2']:.4f}, Q3={s['diff']['q3']:.4f}\n")
+        lines.append(f"Diff(trapezoid): Q1={s['diff']['q1_trapezoid']:.4f}, Q2={s['diff']['q2_trapezoid']:.4f}, Q3={s['diff']['q3_trapezoid']:.4f}\n")
+        lines.append(f"Calculated: Q2s={s['calculated']['q2_start']:.4f}, Q2d={s['calculated']['q2_diff']:.4f}\n")
+        lines.append("\n")
+
     try:
         with open(stats_file, 'w') as f:
-            for cluster in sorted(stats_results.keys()):
-                s = stats_results[cluster]
-                f.write(f"Statistics for Group {cluster}:\n")
-                f.write(f"X: Mean={s['x']['mean']:.4f}, Q1={s['x']['q1']:.4f}, Q2={s['x']['q2']:.4f}, Q3={s['x']['q3']:.4f}\n")
-                f.write(f"Y: Mean={s['y']['mean']:.4f}, Q1={s['y']['q1']:.4f}, Q2={s['y']['q2']:.4f}, Q3={s['y']['q3']:.4f}\n")
-                f.write(f"Diff: Mean={s['diff']['mean']:.4f}, Q1={s['diff']['q1']:.4f}, Q2={s['diff']['q2']:.4f}, Q3={s['diff']['q3']:.4f}\n")
-                f.write(f"Diff(trapezoid): Q1={s['diff']['q1_trapezoid']:.4f}, Q2={s['diff']['q2_trapezoid']:.4f}, Q3={s['diff']['q3_trapezoid']:.4f}\n")
-                f.write(f"Calculated: Q2s={s['calculated']['q2_start']:.4f}, Q2d={s['calculated']['q2_diff']:.4f}\n")
-                f.write("\n")
+            f.write("".join(lines))
     except IOError as e:
         print(f"Error writing to {stats_file}: {e}")
         sys.exit(1)
 
+    lines = ["Group\tX_Mean\tY_Calculated_Mean\tX_Median\tY_Calculated_Median\tg_num\n"]
+    for cluster in sorted(stats_results.keys()):
+        c = stats_results[cluster]['calculated']
+        lines.append(f"{cluster}\t{c['mean_point'][0]:.4f}\t{c['mean_point'][1]:.4f}\t{c['median_point'][0]:.4f}\t{c['median_point'][1]:.4f}\t{c['n']}\n")
+
     try:
         with open(calc_file, 'w') as f:
-            f.write("Group\tX_Mean\tY_Calculated_Mean\tX_Median\tY_Calculated_Median\tg_num\n")
-            for cluster in sorted(stats_results.keys()):
-                s = stats_results[cluster]
-                c = s['calculated']
-                f.write(f"{cluster}\t{c['mean_point'][0]:.4f}\t{c['mean_point'][1]:.4f}\t{c['median_point'][0]:.4f}\t{c['median_point'][1]:.4f}\t{c['n']}\n")
+            f.write("".join(lines))
     except IOError as e:
         print(f"Error writing to {calc_file}: {e}")
         sys.exit(1)
@@ -5,6 +5,10 @@
 #E-mail: akihiro.ezoe@riken.jp
 
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+matplotlib.rcParams['interactive'] = False
+matplotlib.rcParams['figure.max_open_warning'] = 0
 import matplotlib.pyplot as plt
 import numpy as np
 import os
@@ -12,12 +16,21 @@ import argparse
 import json
 import io
 from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.collections import LineCollection
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+CLUSTERED_DATA_DTYPES = {'X': np.float64, 'Y': np.float64, 'Cluster': np.int64}
 
 
 def apply_log2_transform(data, min_value=1e-10):
     data = np.array(data, dtype=float)
-    data = np.where(data <= 0, min_value, data)
-    return np.log2(data), 0
+    np.copyto(data, min_value, where=data <= 0)
+    return np.log2(data, out=data), 0
 
 
 def export_json(output_path, lines_data, stats):
@@ -26,8 +39,12 @@ def export_json(output_path, lines_data, stats):
         'statistics': stats,
         'lines': lines_data
     }
-    with open(output_path, 'w') as f:
-        json.dump(json_data, f, indent=2)
+    if orjson is not None:
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(json_data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(output_path, 'w') as f:
+            json.dump(json_data, f, indent=2)
 
 
 def export_html(output_path, svg_content, title):
@@ -53,6 +70,32 @@ def export_html(output_path, svg_content, title):
         f.write(html_content)
 
 
+def read_table(path, dtype):
+    return pd.read_csv(path, sep=r'\s+', engine='c', header=0, dtype=dtype, memory_map=True)
+
+
+def cached_read_table(path, dtype, use_cache=True, log2_columns=()):
+    cache_path = path + ('.log2.npz' if log2_columns else '.npz')
+    if (use_cache and os.path.exists(cache_path)
+            and os.stat(cache_path).st_mtime_ns > os.stat(path).st_mtime_ns):
+        with np.load(cache_path, allow_pickle=False) as cached:
+            df = pd.DataFrame({name: cached[name] for name in cached.files})
+        # Another script may have written the cache with its own column dtypes.
+        return df.astype({name: t for name, t in dtype.items() if name in df.columns})
+    df = read_table(path, dtype)
+    for name in log2_columns:
+        df[name], _ = apply_log2_transform(df[name])
+    if use_cache:
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **{name: df[name].to_numpy() for name in df.columns})
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+    return df
+
+
 def main():
     parser = argparse.ArgumentParser(description='Generate slope graph')
     parser.add_argument('--format', '-f', choices=['pdf', 'svg', 'png', 'html', 'json'],
@@ -69,21 +112,24 @@ def main():
                         help='Line width (default: 0.5)')
     parser.add_argument('--show-numbers', action='store_true',
                         help='Display count of ascending/descending lines')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always re-parse input files instead of using the parsed-table cache')
     args = parser.parse_args()
     
-    cluster_data = pd.read_csv('output_EZ/clustered_data.txt', sep=r'\s+')
-    
     marker_file = 'output_EZ/.log2_transformed'
     already_transformed = os.path.exists(marker_file)
     
     use_log2 = args.log2
-    if use_log2 and not already_transformed:
+    transform_inputs = use_log2 and not already_transformed
+    if transform_inputs:
         print("Applying log2 transformation...")
-        cluster_data['X'], _ = apply_log2_transform(cluster_data['X'])
-        cluster_data['Y'], _ = apply_log2_transform(cluster_data['Y'])
     elif use_log2 and already_transformed:
         print("Data already log2 transformed in preparation step, skipping transformation.")
     
+    cluster_data = cached_read_table(
+        'output_EZ/clustered_data.txt', CLUSTERED_DATA_DTYPES, not args.no_cache,
+        log2_columns=('X', 'Y') if transform_inputs else ())
+    
     if args.output_prefix:
         base_name = f'output_EZ/{args.output_prefix}_slopegraph'
     else:
@@ -95,11 +141,16 @@ def main():
     else:
         output_filename = f'{base_name}.{args.format}'
     
-    total_pairs = len(cluster_data)
-    differences = cluster_data['Y'] - cluster_data['X']
-    positive_count = int((differences > 0).sum())
-    negative_count = int((differences < 0).sum())
-    tie_count = int((differences == 0).sum())
+    x_data = cluster_data['X'].to_numpy(dtype=float)
+    y_data = cluster_data['Y'].to_numpy(dtype=float)
+    total_pairs = len(x_data)
+    # Computed once; reused for the direction counts and the line colours.
+    differences = y_data - x_data
+    # One bincount over the signs; NaN differences (a missing value) are
+    # dropped first, as they match none of >, < or ==.
+    negative_count, tie_count, positive_count = (
+        int(k) for k in np.bincount(
+            np.sign(differences[~np.isnan(differences)]).astype(np.int8) + 1, minlength=3))
     
     positive_pct = 100 * positive_count / total_pairs
     negative_pct = 100 * negative_count / total_pairs
@@ -111,22 +162,20 @@ def main():
     print(f"No change (tie): {tie_count} ({tie_pct:.1f}%)")
     
     if args.no_outliers:
-        x_data = cluster_data['X'].values
-        y_data = cluster_data['Y'].values
         q1_x, q3_x = np.percentile(x_data, [25, 75])
         q1_y, q3_y = np.percentile(y_data, [25, 75])
         iqr_x, iqr_y = q3_x - q1_x, q3_y - q1_y
         lower_x, upper_x = q1_x - 1.5 * iqr_x, q3_x + 1.5 * iqr_x
         lower_y, upper_y = q1_y - 1.5 * iqr_y, q3_y + 1.5 * iqr_y
         
-        mask = (cluster_data['X'] >= lower_x) & (cluster_data['X'] <= upper_x) & \
-               (cluster_data['Y'] >= lower_y) & (cluster_data['Y'] <= upper_y)
-        plot_data = cluster_data[mask].copy()
-        filtered_count = len(cluster_data) - len(plot_data)
+        mask = (x_data >= lower_x) & (x_data <= upper_x) & \
+               (y_data >= lower_y) & (y_data <= upper_y)
+        x_vals, y_vals, diffs = x_data[mask], y_data[mask], differences[mask]
+        filtered_count = total_pairs - len(x_vals)
         if filtered_count > 0:
             print(f"Filtered out {filtered_count} data points outside whisker range for plotting")
     else:
-        plot_data = cluster_data
+        x_vals, y_vals, diffs = x_data, y_data, differences
     
     stats = {
         'total_pairs': total_pairs,
@@ -145,33 +194,17 @@ def main():
     x_pos = 1.0
     y_pos = 2.0
     
-    lines_data = []
-    
-    for _, row in plot_data.iterrows():
-        x_val = row['X']
-        y_val = row['Y']
-        diff = y_val - x_val
-        
-        if diff > 0:
-            color = 'green'
-            direction = 'ascending'
-        elif diff < 0:
-            color = 'red'
-            direction = 'descending'
-        else:
-            color = 'gray'
-            direction = 'tie'
-        
-        ax.plot([x_pos, y_pos], [x_val, y_val], 
-                color=color, alpha=args.alpha, linewidth=args.linewidth, zorder=2)
-        
-        lines_data.append({
-            'x_start': x_pos,
-            'x_end': y_pos,
-            'y_start': float(x_val),
-            'y_end': float(y_val),
-            'direction': direction
-        })
+    # One collection with per-segment colours keeps the original row draw order
+    segments = np.empty((len(x_vals), 2, 2))
+    segments[:, 0, 0] = x_pos
+    segments[:, 1, 0] = y_pos
+    segments[:, 0, 1] = x_vals
+    segments[:, 1, 1] = y_vals
+    colors = np.where(diffs > 0, 'green', np.where(diffs < 0, 'red', 'gray'))
+    ax.add_collection(LineCollection(segments, colors=colors, alpha=args.alpha,
+                                     linewidths=args.linewidth,
+                                     capstyle='projecting', zorder=2))
+    ax.autoscale_view()
     
     ax.set_xticks([x_pos, y_pos])
     ax.set_xticklabels(['X', 'Y'], fontsize=12)
@@ -207,16 +240,23 @@ def main():
     plt.subplots_adjust(bottom=0.12)
     
     if args.format == 'json':
+        # Per-line records are only materialised for JSON output
+        directions = np.where(diffs > 0, 'ascending',
+                              np.where(diffs < 0, 'descending', 'tie'))
+        lines_data = [
+            {'x_start': x_pos, 'x_end': y_pos, 'y_start': xv, 'y_end': yv, 'direction': d}
+            for xv, yv, d in zip(x_vals.tolist(), y_vals.tolist(), directions.tolist())
+        ]
         export_json(output_filename, lines_data, stats)
     elif args.format == 'html':
-        svg_buffer = io.StringIO()
+        svg_buffer = io.BytesIO()
         plt.savefig(svg_buffer, format='svg')
-        svg_content = svg_buffer.getvalue()
-        svg_content = svg_content[svg_content.find('<svg'):]
+        svg_bytes = svg_buffer.getvalue()
+        svg_content = svg_bytes[svg_bytes.find(b'<svg'):].decode('utf-8')
         export_html(output_filename, svg_content, title)
     elif args.format == 'pdf':
         with PdfPages(output_filename) as pdf:
-            pdf.savefig(fig, dpi=300, bbox_inches='tight')
+            pdf.savefig(fig, bbox_inches='tight')
     else:
         plt.savefig(output_filename, format=args.format, dpi=300 if args.format == 'png' else None, bbox_inches='tight')
     
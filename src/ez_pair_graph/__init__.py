@@ -43,7 +43,7 @@ _PLOT_FILENAMES = {
 def _run_pipeline(x, y, output_dir='output_EZ', format='pdf',
                   output_prefix=None, plots=None,
                   method='hierarchical', max_k=7, linkage_method='ward',
-                  min_cluster_size=5, min_samples=None,
+                  min_cluster_size=5, min_samples=None, hdbscan_backend='native',
                   log2=False, no_outliers=False, show_numbers=False):
     """
     Internal: run the full pipeline on (x, y) arrays.
@@ -78,7 +78,7 @@ def _run_pipeline(x, y, output_dir='output_EZ', format='pdf',
         x, y,
         method=method, max_k=max_k, linkage_method=linkage_method,
         min_cluster_size=min_cluster_size, min_samples=min_samples,
-        log2=log2,
+        log2=log2, hdbscan_backend=hdbscan_backend,
     )
     cx = result['x']
     cy = result['y']
@@ -127,9 +127,9 @@ def _run_pipeline(x, y, output_dir='output_EZ', format='pdf',
             )
 
         # Save — per-plot options matching the Docker shell-script versions.
-        #   slopegraph.py      : PdfPages(dpi=300, bbox='tight'), png(dpi=300, bbox='tight')
+        #   slopegraph.py      : PdfPages(bbox='tight'), png(dpi=300, bbox='tight')
         #   clustered_line_plot : plt.savefig (no bbox), png(dpi=300, no bbox)
-        #   parallel_arrow_plot : PdfPages(dpi=300, bbox='tight'), png(dpi=300, bbox='tight')
+        #   parallel_arrow_plot : PdfPages(bbox='tight'), png(dpi=300, bbox='tight')
         #   trapezoid_plot      : PdfPages(no dpi, no bbox), png(dpi=300, no bbox)
         use_tight = pname in ('slopegraph', 'parallel_arrow')
         bbox = 'tight' if use_tight else None
@@ -137,7 +137,7 @@ def _run_pipeline(x, y, output_dir='output_EZ', format='pdf',
         if format == 'pdf':
             if pname in ('slopegraph', 'parallel_arrow'):
                 with PdfPages(fname) as pdf:
-                    pdf.savefig(fig, dpi=300, bbox_inches='tight')
+                    pdf.savefig(fig, bbox_inches='tight')
             elif pname == 'trapezoid':
                 with PdfPages(fname) as pdf:
                     pdf.savefig(fig)
@@ -177,6 +177,8 @@ def plot(input_file, **kwargs):
         'hierarchical' or 'hdbscan'.
     max_k : int
         Max clusters for hierarchical.
+    hdbscan_backend : str
+        'native' (default) or 'hdbscan' (requires the optional package).
     log2 : bool
         Apply log2 transformation.
     no_outliers : bool
@@ -52,11 +52,17 @@ def main():
     parser.add_argument('--linkage',
                         choices=['ward', 'complete', 'average', 'single'],
                         default='ward',
-                        help='Linkage method for hierarchical (default: ward)')
+                        help='Linkage method for hierarchical (default: ward); all run in '
+                             'O(n^2) via scipy\'s nearest-neighbour chain / MST')
     parser.add_argument('--min-cluster-size', type=int, default=5,
                         help='Min cluster size for HDBSCAN (default: 5)')
     parser.add_argument('--min-samples', type=int, default=None,
                         help='Min samples for HDBSCAN core points')
+    parser.add_argument('--hdbscan-backend',
+                        choices=['native', 'hdbscan'],
+                        default='native',
+                        help='HDBSCAN implementation: built-in (default) or the '
+                             'optional hdbscan package')
 
     args = parser.parse_args()
 
@@ -74,6 +80,7 @@ def main():
             linkage_method=args.linkage,
             min_cluster_size=args.min_cluster_size,
             min_samples=args.min_samples,
+            hdbscan_backend=args.hdbscan_backend,
             log2=args.log2,
             no_outliers=args.no_outliers,
             show_numbers=args.show_numbers,
@@ -10,10 +10,13 @@ Replicates the exact rendering from slopegraph.py, clustered_line_plot.py,
 parallel_arrow_plot.py, and trapezoid_plot.py.
 """
 
+from functools import lru_cache
+
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 from matplotlib.patches import Rectangle, Polygon
+from matplotlib.collections import LineCollection
 from matplotlib.colors import LinearSegmentedColormap
 
 from .preparation import apply_log2_transform, compute_statistics
@@ -38,7 +41,9 @@ _COPYRIGHT_TEXT_ARROW = (
 )
 
 
+@lru_cache(maxsize=16)
 def _create_truncated_colormap(cmap_name, vmin=0.3, vmax=1.0):
+    """Return a cached colormap; the instance is shared, so do not mutate it."""
     cmap = plt.get_cmap(cmap_name)
     colors = cmap(np.linspace(vmin, vmax, 256))
     return LinearSegmentedColormap.from_list(f'trunc_{cmap_name}', colors)
@@ -53,14 +58,13 @@ def _draw_half_boxplot_clustered(ax, data, position, width, side='left',
                                   alpha=0.7, show_outliers=True):
     """Half-boxplot as used in clustered_line_plot.py."""
     data = np.array(data)
-    q1 = np.percentile(data, 25)
-    median = np.percentile(data, 50)
-    q3 = np.percentile(data, 75)
+    sd = np.sort(data)
+    q1, median, q3 = np.percentile(sd, [25, 50, 75])
     iqr = q3 - q1
     lower_whisker = q1 - 1.5 * iqr
     upper_whisker = q3 + 1.5 * iqr
-    whisker_min = data[data >= lower_whisker].min()
-    whisker_max = data[data <= upper_whisker].max()
+    whisker_min = sd[np.searchsorted(sd, lower_whisker, side='left')]
+    whisker_max = sd[np.searchsorted(sd, upper_whisker, side='right') - 1]
     outliers = data[(data < lower_whisker) | (data > upper_whisker)]
     half_width = width / 2
 
@@ -114,15 +118,13 @@ def _draw_half_boxplot_arrow(ax, data, position, width, side='left',
                               facecolor='lightgray', edgecolor='gray',
                               alpha=0.7, show_outliers=True):
     """Half-boxplot as used in parallel_arrow_plot.py (slightly different return)."""
-    data = np.array(data)
-    q1 = np.percentile(data, 25)
-    median = np.percentile(data, 50)
-    q3 = np.percentile(data, 75)
+    sd = np.sort(data)
+    q1, median, q3 = np.percentile(sd, [25, 50, 75])
     iqr = q3 - q1
     lower_whisker = q1 - 1.5 * iqr
     upper_whisker = q3 + 1.5 * iqr
-    whisker_min = data[data >= lower_whisker].min()
-    whisker_max = data[data <= upper_whisker].max()
+    whisker_min = sd[np.searchsorted(sd, lower_whisker, side='left')]
+    whisker_max = sd[np.searchsorted(sd, upper_whisker, side='right') - 1]
     half_width = width / 2
 
     if side == 'left':
@@ -182,6 +184,14 @@ def _build_calculated_points(stats):
     return rows
 
 
+def _point_columns(rows):
+    """Extract X_Mean, Y_Calculated_Mean and g_num arrays from point rows."""
+    xm = np.array([r['X_Mean'] for r in rows], dtype=float)
+    ym = np.array([r['Y_Calculated_Mean'] for r in rows], dtype=float)
+    gn = np.array([r['g_num'] for r in rows], dtype=np.int64)
+    return xm, ym, gn
+
+
 # =========================================================================
 # 1. Slope graph
 # =========================================================================
@@ -192,8 +202,9 @@ def plot_slopegraph(x, y, ax=None, alpha=0.3, linewidth=0.5,
     """
     Render a slope graph.  Replicates slopegraph.py exactly.
     """
-    x = np.asarray(x, dtype=float).copy()
-    y = np.asarray(y, dtype=float).copy()
+    # Never written to in place (log2 returns a new array), so no copy.
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
 
     if log2:
         x = apply_log2_transform(x)
@@ -212,9 +223,11 @@ def plot_slopegraph(x, y, ax=None, alpha=0.3, linewidth=0.5,
 
     total_pairs = len(x)
     diffs = y - x
-    pos_count = int((diffs > 0).sum())
-    neg_count = int((diffs < 0).sum())
-    tie_count = int((diffs == 0).sum())
+    # One bincount over the signs; NaN differences (a missing value) are
+    # dropped first, as they match none of >, < or ==.
+    neg_count, tie_count, pos_count = (
+        int(k) for k in np.bincount(
+            np.sign(diffs[~np.isnan(diffs)]).astype(np.int8) + 1, minlength=3))
     pos_pct = 100 * pos_count / total_pairs
     neg_pct = 100 * neg_count / total_pairs
 
@@ -226,20 +239,20 @@ def plot_slopegraph(x, y, ax=None, alpha=0.3, linewidth=0.5,
         lx, ux = q1x - 1.5 * iqrx, q3x + 1.5 * iqrx
         ly, uy = q1y - 1.5 * iqry, q3y + 1.5 * iqry
         mask = (x >= lx) & (x <= ux) & (y >= ly) & (y <= uy)
-        px, py = x[mask], y[mask]
+        px, py, pdiffs = x[mask], y[mask], diffs[mask]
     else:
-        px, py = x, y
-
-    for xi, yi in zip(px, py):
-        d = yi - xi
-        if d > 0:
-            color = 'green'
-        elif d < 0:
-            color = 'red'
-        else:
-            color = 'gray'
-        ax.plot([x_pos, y_pos], [xi, yi],
-                color=color, alpha=alpha, linewidth=linewidth, zorder=2)
+        px, py, pdiffs = x, y, diffs
+
+    segments = np.empty((len(px), 2, 2))
+    segments[:, 0, 0] = x_pos
+    segments[:, 1, 0] = y_pos
+    segments[:, 0, 1] = px
+    segments[:, 1, 1] = py
+    colors = np.where(pdiffs > 0, 'green', np.where(pdiffs < 0, 'red', 'gray'))
+    ax.add_collection(LineCollection(segments, colors=colors, alpha=alpha,
+                                     linewidths=linewidth,
+                                     capstyle='projecting', zorder=2))
+    ax.autoscale_view()
 
     ax.set_xticks([x_pos, y_pos])
     ax.set_xticklabels(['X', 'Y'], fontsize=12)
@@ -338,23 +351,43 @@ def plot_clustered_lines(x, y, clusters=None, stats=None, ax=None,
     g_min = min(g_nums)
     g_max = max(g_nums)
 
-    for row in filtered:
-        norm = (row['g_num'] - g_min) / (g_max - g_min) if g_max > g_min else 0.5
-        color = plt.cm.Blues(0.3 + 0.7 * norm)
-        lw = 1 + 4 * norm
-
-        ax.plot([x_pos, y_pos],
-                [row['X_Mean'], row['Y_Calculated_Mean']],
-                color=color, linewidth=lw, solid_capstyle='round',
-                zorder=int(10 + 90 * norm))
-
-        if show_numbers:
-            mx = (x_pos + y_pos) / 2
-            my = (row['X_Mean'] + row['Y_Calculated_Mean']) / 2
-            ax.text(mx, my + 0.02 * (y_wmax - y_wmin),
-                    str(int(row['g_num'])), fontsize=7,
-                    color=color, ha='center', va='bottom',
-                    zorder=int(10 + 90 * norm) + 1)
+    g_arr = np.array(g_nums)
+    xm = np.array([r['X_Mean'] for r in filtered], dtype=float)
+    ym = np.array([r['Y_Calculated_Mean'] for r in filtered], dtype=float)
+    if g_max > g_min:
+        norm = (g_arr - g_min) / (g_max - g_min)
+    else:
+        norm = np.full(len(g_arr), 0.5)
+    colors = plt.cm.Blues(0.3 + 0.7 * norm)
+    lws = 1 + 4 * norm
+
+    segments = np.stack([
+        np.column_stack([np.full_like(xm, x_pos), xm]),
+        np.column_stack([np.full_like(ym, y_pos), ym]),
+    ], axis=1)
+    # With labels, one collection per zorder level, each followed by its
+    # labels, keeps the original line/label stacking; without them, a single
+    # collection with the segments in zorder order draws the same image.
+    zorders = (10 + 90 * norm).astype(int)
+    if show_numbers:
+        mx = (x_pos + y_pos) / 2
+        for z in np.unique(zorders).tolist():
+            level = np.flatnonzero(zorders == z)
+            ax.add_collection(LineCollection(segments[level], colors=colors[level],
+                                             linewidths=lws[level],
+                                             capstyle='round', zorder=z))
+            for i in level.tolist():
+                my = (xm[i] + ym[i]) / 2
+                ax.text(mx, my + 0.02 * (y_wmax - y_wmin),
+                        str(int(g_arr[i])), fontsize=7,
+                        color=colors[i], ha='center', va='bottom',
+                        zorder=z + 1)
+    else:
+        order = np.argsort(zorders, kind='stable')
+        ax.add_collection(LineCollection(segments[order], colors=colors[order],
+                                         linewidths=lws[order],
+                                         capstyle='round', zorder=10))
+    ax.autoscale_view()
 
     ax.set_xticks([x_pos, y_pos])
     ax.set_xticklabels(['X', 'Y'])
@@ -395,8 +428,9 @@ def plot_parallel_arrows(x, y, clusters=None, stats=None, ax=None,
     """
     Render a parallel arrow plot.  Replicates parallel_arrow_plot.py exactly.
     """
-    x = np.asarray(x, dtype=float).copy()
-    y = np.asarray(y, dtype=float).copy()
+    # Never written to in place (log2 returns a new array), so no copy.
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
 
     if log2:
         x = apply_log2_transform(x)
@@ -434,27 +468,28 @@ def plot_parallel_arrows(x, y, clusters=None, stats=None, ax=None,
         facecolor='lightgray', edgecolor='gray', alpha=0.7, show_outliers=show_out)
 
     # Filter outside whisker range
-    filt = [r for r in calc_points
-            if w1min <= r['X_Mean'] <= w1max
-            and w2min <= r['Y_Calculated_Mean'] <= w2max]
-    if not filt:
-        filt = calc_points
+    cp_xm, cp_ym, cp_gn = _point_columns(calc_points)
+    keep = ((w1min <= cp_xm) & (cp_xm <= w1max)
+            & (w2min <= cp_ym) & (cp_ym <= w2max))
+    if not keep.any():
+        keep[:] = True
+    idx = np.flatnonzero(keep)
 
-    # Sort by g_num descending (same as original)
-    filt.sort(key=lambda r: r['g_num'], reverse=True)
+    # Sort by g_num descending (same as original); stable keeps ties in order
+    idx = idx[np.argsort(-cp_gn[idx], kind='stable')]
+    f_xm, f_ym, f_gn = cp_xm[idx], cp_ym[idx], cp_gn[idx]
 
-    g_nums = [r['g_num'] for r in filt]
-    max_gn = max(g_nums)
-    min_gn = min(g_nums)
+    max_gn = f_gn.max()
+    min_gn = f_gn.min()
 
     arrow_center = (x_box_pos + y_box_pos) / 2
     arrow_width = 0.15
     arrow_gap = 0.02
 
-    asc_pts = [r for r in filt if r['Y_Calculated_Mean'] > r['X_Mean']]
-    desc_pts = [r for r in filt if r['Y_Calculated_Mean'] <= r['X_Mean']]
-    na = len(asc_pts)
-    nd = len(desc_pts)
+    up = f_ym > f_xm
+    down = f_ym <= f_xm
+    na = int(up.sum())
+    nd = int(down.sum())
 
     if na > 1:
         asc_pos = np.linspace(arrow_center - arrow_width / 2,
@@ -472,9 +507,9 @@ def plot_parallel_arrows(x, y, clusters=None, stats=None, ax=None,
     else:
         desc_pos = []
 
-    all_means = [r['X_Mean'] for r in filt] + [r['Y_Calculated_Mean'] for r in filt]
-    arrow_min = min(all_means)
-    arrow_max = max(all_means)
+    all_means = np.concatenate([f_xm, f_ym])
+    arrow_min = all_means.min()
+    arrow_max = all_means.max()
     bp_min = min(w1min, w2min)
     bp_max = max(w1max, w2max)
     overall_min = min(arrow_min, bp_min)
@@ -485,11 +520,10 @@ def plot_parallel_arrows(x, y, clusters=None, stats=None, ax=None,
     y_max = overall_max + data_range * 0.1
 
     # Draw ascending arrows
-    for i, row in enumerate(asc_pts):
-        xm, ym, gn = row['X_Mean'], row['Y_Calculated_Mean'], row['g_num']
+    for i, (xm, ym, gn) in enumerate(zip(f_xm[up], f_ym[up], f_gn[up])):
         lw = 1 + 7 * (gn - min_gn) / (max_gn - min_gn) if max_gn != min_gn else 4
         cv = (gn - min_gn) / (max_gn - min_gn) if max_gn != min_gn else 0.5
-        color = mcolors.to_rgba(plt.cm.Blues(0.3 + 0.7 * cv))
+        color = plt.cm.Blues(0.3 + 0.7 * cv)
         zv = 10 + int(gn)
         ax_x = asc_pos[i]
         th = data_range * 0.03
@@ -507,11 +541,10 @@ def plot_parallel_arrows(x, y, clusters=None, stats=None, ax=None,
                     color=color, ha='right', va='center', zorder=zv + 1)
 
     # Draw descending arrows
-    for i, row in enumerate(desc_pts):
-        xm, ym, gn = row['X_Mean'], row['Y_Calculated_Mean'], row['g_num']
+    for i, (xm, ym, gn) in enumerate(zip(f_xm[down], f_ym[down], f_gn[down])):
         lw = 1 + 7 * (gn - min_gn) / (max_gn - min_gn) if max_gn != min_gn else 4
         cv = (gn - min_gn) / (max_gn - min_gn) if max_gn != min_gn else 0.5
-        color = mcolors.to_rgba(plt.cm.Blues(0.3 + 0.7 * cv))
+        color = plt.cm.Blues(0.3 + 0.7 * cv)
         zv = 10 + int(gn)
         ax_x = desc_pos[i]
         th = data_range * 0.03
@@ -551,8 +584,8 @@ def plot_parallel_arrows(x, y, clusters=None, stats=None, ax=None,
         cbar.set_ticklabels([str(int(min_gn)), str(int(max_gn))])
         cbar.ax.set_title('g_num', fontsize=10, pad=5)
         cbar.ax.tick_params(labelsize=9)
-        plt.subplots_adjust(left=0.1, right=0.88, top=0.9, bottom=0.15)
-        plt.figtext(0.5, 0.02, _COPYRIGHT_TEXT_ARROW, ha='center', fontsize=8, color='black')
+        fig.subplots_adjust(left=0.1, right=0.88, top=0.9, bottom=0.15)
+        fig.text(0.5, 0.02, _COPYRIGHT_TEXT_ARROW, ha='center', fontsize=8, color='black')
 
     return fig, ax
 
@@ -568,42 +601,44 @@ def _calculate_quartiles(length):
 
 
 def _check_outliers_extent(data):
-    if not data or len(data) <= 4:
+    if data is None or len(data) <= 4:
         return False
     if isinstance(data[0], list):
-        flat = []
-        for s in data:
-            flat.extend(s)
-        data = flat
-    sd = sorted(data)
-    n = len(sd)
-    q1 = sd[int(n / 4)]
-    q3 = sd[int(3 * n / 4)]
+        data = np.concatenate(data)
+    arr = np.asarray(data, dtype=float)
+    n = len(arr)
+    q1i, q3i = int(n / 4), int(3 * n / 4)
+    part = np.partition(arr, [q1i, q3i])
+    q1, q3 = part[q1i], part[q3i]
     iqr = q3 - q1
     lt, ut = q1 - 1.5 * iqr, q3 + 1.5 * iqr
-    outliers = [v for v in sd if v < lt or v > ut]
-    if not outliers:
+    out = (arr < lt) | (arr > ut)
+    if not out.any():
         return False
-    non_out = [v for v in sd if lt <= v <= ut]
-    no_min = min(non_out) if non_out else min(sd)
-    no_max = max(non_out) if non_out else max(sd)
+    outliers = arr[out]
+    non_out = arr[~out]
+    if len(non_out):
+        no_min, no_max = non_out.min(), non_out.max()
+    else:
+        no_min, no_max = arr.min(), arr.max()
     extent = 0
-    if min(outliers) < no_min:
-        extent += no_min - min(outliers)
-    if max(outliers) > no_max:
-        extent += max(outliers) - no_max
-    return extent > (max(sd) - min(sd)) / 3
-
-
-def _get_whisker_range(data):
-    sd = sorted(data)
-    q1 = np.percentile(sd, 25)
-    q3 = np.percentile(sd, 75)
+    if outliers.min() < no_min:
+        extent += no_min - outliers.min()
+    if outliers.max() > no_max:
+        extent += outliers.max() - no_max
+    return bool(extent > (arr.max() - arr.min()) / 3)
+
+
+def _get_whisker_range(data, quartiles=None):
+    data = np.asarray(data, dtype=float)
+    if quartiles is None:
+        quartiles = np.percentile(data, [25, 50, 75])
+    q1, _, q3 = quartiles
     iqr = q3 - q1
     lw = q1 - 1.5 * iqr
     uw = q3 + 1.5 * iqr
-    wmin = min([v for v in sd if v >= lw])
-    wmax = max([v for v in sd if v <= uw])
+    wmin = data[data >= lw].min()
+    wmax = data[data <= uw].max()
     return wmin, wmax
 
 
@@ -613,8 +648,9 @@ def plot_trapezoid(x, y, ax=None,
     """
     Render a trapezoid plot.  Replicates trapezoid_plot.py exactly.
     """
-    x = np.asarray(x, dtype=float).copy()
-    y = np.asarray(y, dtype=float).copy()
+    # Never written to in place (log2 returns a new array), so no copy.
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
 
     if log2:
         x = apply_log2_transform(x)
@@ -623,24 +659,18 @@ def plot_trapezoid(x, y, ax=None,
     show_log2 = log2 or _log2_labels
 
     # Separate by direction
-    sabun_up = []
-    sabun_tie = []
-    sabun_down = []
-    for xi, yi in zip(x, y):
-        d = yi - xi
-        if d > 0:
-            sabun_up.append([xi, yi, d])
-        elif d == 0:
-            sabun_tie.append([xi, yi, d])
-        else:
-            sabun_down.append([xi, yi, d])
-
-    sorted_sabun_up = sorted(list(sabun_up), key=lambda v: v[0], reverse=True)
-    sorted_sabun_down = sorted(list(sabun_down), key=lambda v: v[0], reverse=True)
-
-    num_up_total = len(sabun_up)
-    num_down_total = len(sabun_down)
-    num_tie_total = len(sabun_tie)
+    d = y - x
+    up, tie, down = d > 0, d == 0, d < 0
+    sabun_up = np.vstack([x[up], y[up], d[up]]).T
+    sabun_tie = np.vstack([x[tie], y[tie], d[tie]]).T
+    sabun_down = np.vstack([x[down], y[down], d[down]]).T
+
+    sorted_sabun_up = sabun_up[np.argsort(-sabun_up[:, 0], kind='stable')]
+    sorted_sabun_down = sabun_down[np.argsort(-sabun_down[:, 0], kind='stable')]
+
+    num_up_total = int(up.sum())
+    num_down_total = int(down.sum())
+    num_tie_total = int(tie.sum())
 
     # ---- plotting ----
     own_fig = ax is None
@@ -652,12 +682,11 @@ def plot_trapezoid(x, y, ax=None,
     x_pos = 1.0
     y_pos = 1.4
 
-    all_data = [
-        [it[0] for it in sorted_sabun_up + sorted_sabun_down + sabun_tie],
-        [it[1] for it in sorted_sabun_up + sorted_sabun_down + sabun_tie],
-    ]
+    groups = (sorted_sabun_up, sorted_sabun_down, sabun_tie)
+    all_data = [np.concatenate([g[:, 0] for g in groups]),
+                np.concatenate([g[:, 1] for g in groups])]
 
-    _check_outliers_extent([v for sub in all_data for v in sub])
+    _check_outliers_extent(np.concatenate(all_data))
 
     gray_color = 'gray'
     bp = ax.boxplot(all_data, positions=[x_pos, y_pos], widths=0.35,
@@ -672,8 +701,10 @@ def plot_trapezoid(x, y, ax=None,
         patch.set_edgecolor(gray_color)
         patch.set_alpha(0.8)
 
-    w1min, w1max = _get_whisker_range(all_data[0])
-    w2min, w2max = _get_whisker_range(all_data[1])
+    qs0 = np.percentile(all_data[0], [25, 50, 75])
+    qs1 = np.percentile(all_data[1], [25, 50, 75])
+    w1min, w1max = _get_whisker_range(all_data[0], qs0)
+    w2min, w2max = _get_whisker_range(all_data[1], qs1)
 
     yl, yh = ax.get_ylim()
     rect1 = Rectangle((x_pos, yl), 0.35, yh - yl,
@@ -687,21 +718,20 @@ def plot_trapezoid(x, y, ax=None,
     ax.plot([y_pos, y_pos], [w2min, w2max], color=gray_color, linewidth=1, zorder=6)
 
     if no_outliers:
-        d0 = np.array(all_data[0])
-        d1 = np.array(all_data[1])
-        q1_0, q3_0 = np.percentile(d0, [25, 75])
-        q1_1, q3_1 = np.percentile(d1, [25, 75])
+        q1_0, _, q3_0 = qs0
+        q1_1, _, q3_1 = qs1
         iqr0, iqr1 = q3_0 - q1_0, q3_1 - q1_1
         l0, u0 = q1_0 - 1.5 * iqr0, q3_0 + 1.5 * iqr0
         l1, u1 = q1_1 - 1.5 * iqr1, q3_1 + 1.5 * iqr1
-        sorted_sabun_up = [it for it in sorted_sabun_up
-                           if l0 <= it[0] <= u0 and l1 <= it[1] <= u1]
-        sorted_sabun_down = [it for it in sorted_sabun_down
-                             if l0 <= it[0] <= u0 and l1 <= it[1] <= u1]
-        sabun_up = [it for it in sabun_up
-                    if l0 <= it[0] <= u0 and l1 <= it[1] <= u1]
-        sabun_down = [it for it in sabun_down
-                      if l0 <= it[0] <= u0 and l1 <= it[1] <= u1]
+
+        def in_whiskers(a):
+            return ((a[:, 0] >= l0) & (a[:, 0] <= u0) &
+                    (a[:, 1] >= l1) & (a[:, 1] <= u1))
+
+        sorted_sabun_up = sorted_sabun_up[in_whiskers(sorted_sabun_up)]
+        sorted_sabun_down = sorted_sabun_down[in_whiskers(sorted_sabun_down)]
+        sabun_up = sabun_up[in_whiskers(sabun_up)]
+        sabun_down = sabun_down[in_whiskers(sabun_down)]
 
     num_up_display = num_up_total
     num_down_display = num_down_total
@@ -717,27 +747,31 @@ def plot_trapezoid(x, y, ax=None,
     down_z = 10 + int(10 * num_down_display / total) if total > 0 else 10
 
     # Ascending trapezoid
-    if sabun_up:
+    if len(sabun_up):
         nuf = len(sorted_sabun_up)
         q1i, q2i, q3i = _calculate_quartiles(nuf)
-        sorted_slope_up = sorted(list(sabun_up), key=lambda v: v[2], reverse=True)
+        slope_up = -np.partition(-sabun_up[:, 2], [q1i, q2i, q3i])
 
         q1s = sorted_sabun_up[q1i][0]
-        q1d = sorted_slope_up[q1i][2]
+        q1d = slope_up[q1i]
         q1e = q1s + q1d
         q2s = sorted_sabun_up[q2i][0]
-        q2d = sorted_slope_up[q2i][2]
+        q2d = slope_up[q2i]
         q2e = q2s + q2d
         q3s = sorted_sabun_up[q3i][0]
-        q3d = sorted_slope_up[q3i][2]
+        q3d = slope_up[q3i]
         q3e = q3s + q3d
 
         ulc = (0, up_ci, 0)
-        ax.plot([x_pos, y_pos], [q1s, q1e], color=ulc, linestyle=':', linewidth=2, alpha=up_alpha, zorder=up_z)
-        ax.plot([x_pos, y_pos], [q2s, q2e], color=ulc, linestyle='-', linewidth=up_width, alpha=up_alpha, zorder=up_z)
-        ax.plot([x_pos, y_pos], [q3s, q3e], color=ulc, linestyle=':', linewidth=2, alpha=up_alpha, zorder=up_z)
-        ax.fill([x_pos, y_pos, y_pos, x_pos], [q1s, q1e, q3e, q3s],
-                color='green', alpha=0.2, zorder=8)
+        ax.add_collection(LineCollection(
+            [[(x_pos, q1s), (y_pos, q1e)],
+             [(x_pos, q2s), (y_pos, q2e)],
+             [(x_pos, q3s), (y_pos, q3e)]],
+            colors=[ulc], linestyles=[':', '-', ':'],
+            linewidths=[2, up_width, 2], alpha=up_alpha, zorder=up_z))
+        ax.add_patch(Polygon([(x_pos, q1s), (y_pos, q1e), (y_pos, q3e), (x_pos, q3s)],
+                             color='green', alpha=0.2, zorder=8))
+        ax.autoscale_view()
 
         if show_numbers:
             mx = (x_pos + y_pos) / 2
@@ -748,27 +782,31 @@ def plot_trapezoid(x, y, ax=None,
                     fontweight='bold', zorder=up_z + 1)
 
     # Descending trapezoid
-    if sabun_down:
+    if len(sabun_down):
         ndf = len(sorted_sabun_down)
         q1i, q2i, q3i = _calculate_quartiles(ndf)
-        sorted_slope_down = sorted(list(sabun_down), key=lambda v: v[2], reverse=True)
+        slope_down = -np.partition(-sabun_down[:, 2], [q1i, q2i, q3i])
 
         q1s = sorted_sabun_down[q1i][0]
-        q1d = sorted_slope_down[q1i][2]
+        q1d = slope_down[q1i]
         q1e = q1s + q1d
         q2s = sorted_sabun_down[q2i][0]
-        q2d = sorted_slope_down[q2i][2]
+        q2d = slope_down[q2i]
         q2e = q2s + q2d
         q3s = sorted_sabun_down[q3i][0]
-        q3d = sorted_slope_down[q3i][2]
+        q3d = slope_down[q3i]
         q3e = q3s + q3d
 
         dlc = (down_ci, 0, 0)
-        ax.plot([x_pos, y_pos], [q1s, q1e], color=dlc, linestyle=':', linewidth=2, alpha=down_alpha, zorder=down_z)
-        ax.plot([x_pos, y_pos], [q2s, q2e], color=dlc, linestyle='-', linewidth=down_width, alpha=down_alpha, zorder=down_z)
-        ax.plot([x_pos, y_pos], [q3s, q3e], color=dlc, linestyle=':', linewidth=2, alpha=down_alpha, zorder=down_z)
-        ax.fill([x_pos, y_pos, y_pos, x_pos], [q1s, q1e, q3e, q3s],
-                color='red', alpha=0.2, zorder=8)
+        ax.add_collection(LineCollection(
+            [[(x_pos, q1s), (y_pos, q1e)],
+             [(x_pos, q2s), (y_pos, q2e)],
+             [(x_pos, q3s), (y_pos, q3e)]],
+            colors=[dlc], linestyles=[':', '-', ':'],
+            linewidths=[2, down_width, 2], alpha=down_alpha, zorder=down_z))
+        ax.add_patch(Polygon([(x_pos, q1s), (y_pos, q1e), (y_pos, q3e), (x_pos, q3s)],
+                             color='red', alpha=0.2, zorder=8))
+        ax.autoscale_view()
 
         if show_numbers:
             mx = (x_pos + y_pos) / 2
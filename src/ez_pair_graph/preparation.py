@@ -9,9 +9,24 @@ Core data preparation: clustering and statistics computation.
 Replicates the exact logic from preparation_1.py and preparation_2.py.
 """
 
+import math
+import re
+
 import numpy as np
 from scipy.cluster.hierarchy import linkage, fcluster
-from scipy.spatial.distance import pdist, squareform
+from scipy.spatial.distance import pdist
+
+# Optional: with Numba installed, the HDBSCAN loops below are compiled (cached
+# on disk after the first run) and the MST skips the pdist buffer.
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+try:
+    import hdbscan as _hdbscan_lib
+except ImportError:
+    _hdbscan_lib = None
 
 
 # ---------------------------------------------------------------------------
@@ -20,8 +35,8 @@ from scipy.spatial.distance import pdist, squareform
 
 def apply_log2_transform(data, min_value=1e-10):
     data = np.array(data, dtype=float)
-    data = np.where(data <= 0, min_value, data)
-    return np.log2(data)
+    np.copyto(data, min_value, where=data <= 0)
+    return np.log2(data, out=data)
 
 
 def filter_non_positive_for_log2(x, y):
@@ -45,61 +60,71 @@ def detect_delimiter(line):
         return None
 
 
+# A field float() accepts, minus exotic forms like digit underscores.
+_NUMBER = r'[-+]?(?:(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|inf(?:inity)?|nan)'
+
+# First two fields numeric, keyed by the delimiter detect_delimiter returns.
+_PAIR_PATTERNS = {
+    ',': re.compile(rf'\s*({_NUMBER})\s*,\s*({_NUMBER})\s*(?:,|$)', re.IGNORECASE),
+    '\t': re.compile(rf'\s*({_NUMBER})\s*\t\s*({_NUMBER})\s*(?:\t|$)', re.IGNORECASE),
+    None: re.compile(rf'\s*({_NUMBER})\s+({_NUMBER})(?:\s|$)', re.IGNORECASE),
+}
+
+
 def is_header_line(line, delimiter):
-    if delimiter:
-        parts = [p.strip() for p in line.split(delimiter)]
-    else:
-        parts = line.split()
-    if len(parts) < 2:
-        return False
-    try:
-        float(parts[0])
-        float(parts[1])
+    if _PAIR_PATTERNS[delimiter].match(line):
         return False
-    except ValueError:
-        return True
+    parts = line.split(delimiter) if delimiter else line.split()
+    return len(parts) >= 2
 
 
 def parse_line(line, delimiter):
-    if delimiter:
-        parts = [p.strip() for p in line.split(delimiter)]
-    else:
-        parts = line.split()
-    if len(parts) < 2:
-        return None
-    try:
-        x = float(parts[0])
-        y = float(parts[1])
-        return (x, y)
-    except ValueError:
+    m = _PAIR_PATTERNS[delimiter].match(line)
+    if m is None:
         return None
+    return (float(m[1]), float(m[2]))
+
+
+def _parse_lines(input_file, delimiter, skip_lines):
+    data = []
+    with open(input_file, 'r') as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if line_num <= skip_lines or not line:
+                continue
+            result = parse_line(line, delimiter)
+            if result:
+                data.append(result)
+    return np.array(data) if data else np.empty((0, 2))
 
 
 def load_data(input_file):
     """Load paired data from a text/csv file.  Returns (x_array, y_array)."""
-    data = []
     delimiter = None
-    header_skipped = False
+    skip_lines = 0
 
     with open(input_file, 'r') as f:
         for line_num, line in enumerate(f, 1):
             line = line.strip()
             if not line:
                 continue
-            if delimiter is None and line_num == 1:
+            if line_num == 1:
                 delimiter = detect_delimiter(line)
-            if not header_skipped:
-                if is_header_line(line, delimiter):
-                    header_skipped = True
-                    continue
-                header_skipped = True
-            result = parse_line(line, delimiter)
-            if result:
-                data.append(result)
+            if is_header_line(line, delimiter):
+                skip_lines = line_num
+            break
+        else:
+            return np.array([]), np.array([])
+
+    try:
+        arr = np.loadtxt(input_file, delimiter=delimiter, skiprows=skip_lines,
+                         usecols=(0, 1), comments=None, ndmin=2)
+    except ValueError:
+        # Malformed rows: fall back to the line parser, which skips them.
+        arr = _parse_lines(input_file, delimiter, skip_lines)
 
-    if not data:
+    if not len(arr):
         return np.array([]), np.array([])
-    arr = np.array(data)
     return arr[:, 0], arr[:, 1]
 
 
@@ -107,38 +132,36 @@ def load_data(input_file):
 # Clustering — hierarchical
 # ---------------------------------------------------------------------------
 
-def _find_optimal_k_elbow(data, max_k=7):
+# scipy runs these methods in O(n^2) (nearest-neighbour chain, or the MST
+# for single); centroid/median fall back to the generic O(n^3) algorithm.
+_NN_CHAIN_METHODS = ('ward', 'complete', 'average', 'weighted', 'single')
+_NN_CHAIN_REQUIRED_N = 2000
+
+
+def _within_cluster_ss(data, clusters):
+    """Total within-cluster sum of squares for integer cluster labels."""
+    counts = np.bincount(clusters)
+    sums = np.column_stack([np.bincount(clusters, weights=col) for col in data.T])
+    centroids = sums / np.maximum(counts, 1)[:, None]
+    return np.sum((data - centroids[clusters]) ** 2)
+
+
+def _find_optimal_k_elbow(data, Z, max_k=7):
     n = len(data)
     if n <= 3:
         return 1
     max_k = min(max_k, n)
 
-    Z = linkage(data, method='ward')
-    wss_list = []
-    for k in range(1, max_k + 1):
-        if k == 1:
-            centroid = np.mean(data, axis=0)
-            wss = np.sum((data - centroid) ** 2)
-        else:
-            clusters = fcluster(Z, t=k, criterion='maxclust')
-            wss = 0
-            for cid in range(1, k + 1):
-                pts = data[clusters == cid]
-                if len(pts) > 0:
-                    c = np.mean(pts, axis=0)
-                    wss += np.sum((pts - c) ** 2)
-        wss_list.append(wss)
+    wss_list = [np.sum((data - np.mean(data, axis=0)) ** 2)]
+    for k in range(2, max_k + 1):
+        clusters = fcluster(Z, t=k, criterion='maxclust')
+        wss_list.append(_within_cluster_ss(data, clusters))
 
     if len(wss_list) < 3:
         return min(2, n)
 
-    angles = []
-    for i in range(1, len(wss_list) - 1):
-        a1 = np.arctan2(wss_list[i - 1] - wss_list[i], 1)
-        a2 = np.arctan2(wss_list[i] - wss_list[i + 1], 1)
-        angles.append(abs(a1 - a2))
-    if not angles:
-        return 2
+    slopes = np.arctan2(-np.diff(wss_list), 1)
+    angles = np.abs(np.diff(slopes))
     return np.argmax(angles) + 2
 
 
@@ -148,8 +171,15 @@ def _hierarchical_clustering(data, max_k=7, method='ward'):
         return np.array([], dtype=int), 0
     if n == 1:
         return np.array([0]), 1
-    optimal_k = _find_optimal_k_elbow(data, max_k)
-    Z = linkage(data, method=method)
+    if n > _NN_CHAIN_REQUIRED_N and method not in _NN_CHAIN_METHODS:
+        raise ValueError(f"Linkage '{method}' is O(n^3) in scipy; use one of "
+                         f"{', '.join(_NN_CHAIN_METHODS)} for more than {_NN_CHAIN_REQUIRED_N} points")
+    # One condensed distance vector feeds every linkage call below.
+    y = pdist(data)
+    # The elbow is always judged on the ward tree; reuse it for ward clustering.
+    ward_Z = linkage(y, method='ward')
+    optimal_k = _find_optimal_k_elbow(data, ward_Z, max_k)
+    Z = ward_Z if method == 'ward' else linkage(y, method=method)
     clusters = fcluster(Z, t=optimal_k, criterion='maxclust') - 1
     return clusters, optimal_k
 
@@ -158,189 +188,274 @@ def _hierarchical_clustering(data, max_k=7, method='ward'):
 # Clustering — HDBSCAN (native implementation, identical to preparation_1.py)
 # ---------------------------------------------------------------------------
 
-def _compute_core_distances(distance_matrix, min_samples):
-    n = distance_matrix.shape[0]
-    core_distances = np.zeros(n)
-    for i in range(n):
-        sd = np.sort(distance_matrix[i])
-        if min_samples < len(sd):
-            core_distances[i] = sd[min_samples]
-        else:
-            core_distances[i] = sd[-1]
+def _condensed_rows(condensed, n, rows):
+    """Expand full distance-matrix rows from a condensed pdist vector."""
+    out = np.zeros((len(rows), n), dtype=condensed.dtype)
+    if len(rows) == 0:
+        return out
+    # Entry (j, i) with j < i sits at lower_base[j] + i in the condensed
+    # vector; the entries (i, j > i) are one contiguous run starting at row i's
+    # offset. Only 1-D index vectors are built, never a (rows, n) grid.
+    j = np.arange(rows.max())
+    lower_base = n * j - j * (j + 3) // 2 - 1
+    for r, i in enumerate(rows.tolist()):
+        start = n * i - i * (i + 1) // 2
+        out[r, i + 1:] = condensed[start:start + n - i - 1]
+        out[r, :i] = condensed[lower_base[:i] + i]
+    return out
+
+
+def _compute_core_distances(condensed, n, min_samples, block_size=1024):
+    # Work through the rows in blocks so only a (block_size, n) slice of the
+    # square distance matrix is ever expanded at once.
+    k = min(min_samples, n - 1)
+    core_distances = np.empty(n, dtype=condensed.dtype)
+    for start in range(0, n, block_size):
+        rows = np.arange(start, min(start + block_size, n))
+        block = _condensed_rows(condensed, n, rows)
+        core_distances[rows] = np.partition(block, k, axis=1)[:, k]
     return core_distances
 
 
-def _compute_mutual_reachability_distance(distance_matrix, core_distances):
-    n = distance_matrix.shape[0]
-    mr = np.zeros((n, n))
-    for i in range(n):
+def _core_distances_loop(data, k):
+    # One thread per row: rebuild the row's distances in float32, exactly as
+    # pdist(...).astype(np.float32) would, and select the k-th smallest.
+    n, dim = data.shape
+    core_distances = np.empty(n, dtype=np.float32)
+    for i in prange(n):
+        row = np.empty(n, dtype=np.float32)
         for j in range(n):
-            mr[i, j] = max(core_distances[i], core_distances[j], distance_matrix[i, j])
-    return mr
+            s = 0.0
+            for c in range(dim):
+                t = data[i, c] - data[j, c]
+                s += t * t
+            row[j] = math.sqrt(s)
+        core_distances[i] = np.partition(row, k)[k]
+    return core_distances
+
+
+def _prim_points_loop(data, core_distances):
+    # Prim over the implicit mutual reachability graph; each step relaxes
+    # the frontier in parallel, computing distances from the coordinates.
+    n, dim = data.shape
+    in_tree = np.zeros(n, dtype=np.bool_)
+    min_dist = np.full(n, np.inf)
+    parent = np.full(n, -1, dtype=np.int64)
+    edges = np.empty((n - 1, 3))
+    u = 0
+    for k in range(n - 1):
+        in_tree[u] = True
+        for v in prange(n):
+            if not in_tree[v]:
+                s = 0.0
+                for c in range(dim):
+                    t = data[u, c] - data[v, c]
+                    s += t * t
+                d = max(np.float32(math.sqrt(s)), core_distances[u], core_distances[v])
+                if d < min_dist[v]:
+                    min_dist[v] = d
+                    parent[v] = u
+        nxt = -1
+        for v in range(n):
+            if not in_tree[v] and (nxt == -1 or min_dist[v] < min_dist[nxt]):
+                nxt = v
+        edges[k, 0] = parent[nxt]
+        edges[k, 1] = nxt
+        edges[k, 2] = min_dist[nxt]
+        u = nxt
+    return edges
 
 
-def _minimum_spanning_tree_prim(distance_matrix):
-    n = distance_matrix.shape[0]
+if njit is not None:
+    _parallel_core_distances = njit(parallel=True, cache=True)(_core_distances_loop)
+    _parallel_prim = njit(parallel=True, cache=True)(_prim_points_loop)
+else:
+    _parallel_core_distances = None
+    _parallel_prim = None
+
+
+def _minimum_spanning_tree(condensed, core_distances, n):
+    # Prim over the condensed vector, expanding one row per step and
+    # relaxing the frontier with NumPy masks.
     in_tree = np.zeros(n, dtype=bool)
     min_dist = np.full(n, np.inf)
-    min_dist[0] = 0
     parent = np.full(n, -1, dtype=int)
-    edges = []
-    for _ in range(n):
-        u = -1
-        for i in range(n):
-            if not in_tree[i] and (u == -1 or min_dist[i] < min_dist[u]):
-                u = i
+    edges = np.empty((n - 1, 3))
+    u = 0
+    for k in range(n - 1):
         in_tree[u] = True
-        if parent[u] != -1:
-            edges.append((parent[u], u, min_dist[u]))
-        for v in range(n):
-            if not in_tree[v] and distance_matrix[u, v] < min_dist[v]:
-                min_dist[v] = distance_matrix[u, v]
-                parent[v] = u
+        row = _condensed_rows(condensed, n, np.array([u]))[0]
+        row = np.maximum(row, np.maximum(core_distances[u], core_distances))
+        better = ~in_tree & (row < min_dist)
+        min_dist[better] = row[better]
+        parent[better] = u
+        u = np.where(in_tree, np.inf, min_dist).argmin()
+        edges[k] = (parent[u], u, min_dist[u])
     return edges
 
 
-class _UnionFind:
-    def __init__(self, n):
-        self.parent = list(range(n))
-        self.rank = [0] * n
-        self.size = [1] * n
+def _uf_find(parent, x):
+    # Path splitting: point every node on the walk at its grandparent.
+    while parent[x] != x:
+        parent[x], x = parent[parent[x]], parent[x]
+    return x
 
-    def find(self, x):
-        if self.parent[x] != x:
-            self.parent[x] = self.find(self.parent[x])
-        return self.parent[x]
 
-    def union(self, x, y):
-        px, py = self.find(x), self.find(y)
-        if px == py:
-            return False
-        if self.rank[px] < self.rank[py]:
-            px, py = py, px
-        self.parent[py] = px
-        self.size[px] += self.size[py]
-        if self.rank[px] == self.rank[py]:
-            self.rank[px] += 1
-        return True
+def _uf_union(parent, rank, size, x, y):
+    """Union two roots by rank and return the surviving root."""
+    if rank[x] < rank[y]:
+        x, y = y, x
+    parent[y] = x
+    size[x] += size[y]
+    if rank[x] == rank[y]:
+        rank[x] += 1
+    return x
 
-    def get_size(self, x):
-        return self.size[self.find(x)]
 
+if njit is not None:
+    _uf_find = njit(cache=True)(_uf_find)
+    _uf_union = njit(cache=True)(_uf_union)
 
-def _build_condensed_tree(mst_edges, n_points, min_cluster_size):
-    sorted_edges = sorted(mst_edges, key=lambda x: x[2])
-    uf = _UnionFind(n_points)
-    cluster_labels = np.arange(n_points)
-    next_cluster_id = n_points
-    tree = []
-    cluster_sizes = {i: 1 for i in range(n_points)}
-    cluster_birth = {i: 0.0 for i in range(n_points)}
 
-    for u, v, dist in sorted_edges:
-        cu, cv = uf.find(u), uf.find(v)
+def _condense_edges(edges, parent, rank, size, cluster_labels,
+                    tree, cluster_sizes, cluster_birth, n_points):
+    """Merge sorted MST edges into the condensed tree; return rows written."""
+    next_cluster_id = n_points
+    k = 0
+    for i in range(edges.shape[0]):
+        cu = _uf_find(parent, int(edges[i, 0]))
+        cv = _uf_find(parent, int(edges[i, 1]))
         if cu != cv:
-            size_u = uf.get_size(u)
-            size_v = uf.get_size(v)
+            dist = edges[i, 2]
             lambda_val = 1.0 / dist if dist > 0 else np.inf
             new_cluster = next_cluster_id
             next_cluster_id += 1
-            tree.append({
-                'parent': new_cluster,
-                'child': cluster_labels[cu],
-                'child_size': size_u,
-                'lambda_val': lambda_val
-            })
-            tree.append({
-                'parent': new_cluster,
-                'child': cluster_labels[cv],
-                'child_size': size_v,
-                'lambda_val': lambda_val
-            })
-            cluster_sizes[new_cluster] = size_u + size_v
+            tree[k, 0] = new_cluster
+            tree[k, 1] = cluster_labels[cu]
+            tree[k, 2] = size[cu]
+            tree[k, 3] = lambda_val
+            tree[k + 1, 0] = new_cluster
+            tree[k + 1, 1] = cluster_labels[cv]
+            tree[k + 1, 2] = size[cv]
+            tree[k + 1, 3] = lambda_val
+            k += 2
+            cluster_sizes[new_cluster] = size[cu] + size[cv]
             cluster_birth[new_cluster] = lambda_val
-            uf.union(u, v)
-            root = uf.find(u)
+            root = _uf_union(parent, rank, size, cu, cv)
             cluster_labels[root] = new_cluster
+    return k
 
-    n_clusters = next_cluster_id - n_points
-    return tree, cluster_sizes, cluster_birth, n_clusters
 
+if njit is not None:
+    _condense_edges = njit(cache=True)(_condense_edges)
 
-def _extract_clusters_eom(tree, cluster_sizes, cluster_birth, n_clusters, n_points, min_cluster_size):
-    if not tree:
-        return np.zeros(n_points, dtype=int)
 
-    all_clusters = set()
-    cluster_children = {}
-    cluster_lambda_max = {}
-
-    for entry in tree:
-        parent = entry['parent']
-        child = entry['child']
-        lv = entry['lambda_val']
-        all_clusters.add(parent)
-        all_clusters.add(child)
-        if parent not in cluster_children:
-            cluster_children[parent] = []
-        cluster_children[parent].append(child)
-        if child not in cluster_lambda_max:
-            cluster_lambda_max[child] = lv
+def _build_condensed_tree(mst_edges, n_points, min_cluster_size):
+    edges = np.asarray(mst_edges, dtype=np.float64).reshape(-1, 3)
+    edges = edges[np.argsort(edges[:, 2], kind='stable')]
+    parent = np.arange(n_points, dtype=np.int32)
+    rank = np.zeros(n_points, dtype=np.uint8)
+    size = np.ones(n_points, dtype=np.int64)
+    cluster_labels = np.arange(n_points, dtype=np.int64)
+    tree = np.empty((2 * (n_points - 1), 4))
+    cluster_sizes = np.ones(2 * n_points, dtype=np.int64)
+    cluster_birth = np.zeros(2 * n_points)
+    k = _condense_edges(edges, parent, rank, size, cluster_labels,
+                        tree, cluster_sizes, cluster_birth, n_points)
+    n_clusters = k // 2
+    return tree[:k], cluster_sizes, cluster_birth, n_clusters
+
+
+def _select_eom_clusters(children_ptr, children_idx, stability, sizes,
+                         n_points, root, min_cluster_size):
+    """Excess-of-mass selection as one ascending pass over cluster ids."""
+    # Children always have smaller ids than their parent, so ascending id
+    # order is a post-order walk of the condensed tree.
+    subtree = stability.copy()
+    selected = np.zeros(sizes.shape[0], dtype=np.bool_)
+    for c in range(n_points, root + 1):
+        lo, hi = children_ptr[c], children_ptr[c + 1]
+        if lo == hi:
+            continue
+        children_stab = 0.0
+        for j in range(lo, hi):
+            children_stab += subtree[children_idx[j]]
+        if stability[c] > children_stab:
+            for j in range(lo, hi):
+                selected[children_idx[j]] = False
+            if sizes[c] >= min_cluster_size:
+                selected[c] = True
         else:
-            cluster_lambda_max[child] = max(cluster_lambda_max[child], lv)
+            subtree[c] = children_stab
+    return selected
 
-    cluster_stability = {}
-    for c in all_clusters:
-        if c < n_points:
-            cluster_stability[c] = 0
-        else:
-            birth = cluster_birth.get(c, 0)
-            death = cluster_lambda_max.get(c, birth)
-            size = cluster_sizes.get(c, 0)
-            cluster_stability[c] = (death - birth) * size
-
-    selected_clusters = set()
-
-    def select_clusters(cluster):
-        children = cluster_children.get(cluster, [])
-        if not children:
-            return cluster_stability.get(cluster, 0)
-        children_stab = sum(select_clusters(ch) for ch in children)
-        own_stab = cluster_stability.get(cluster, 0)
-        if own_stab > children_stab:
-            for ch in children:
-                selected_clusters.discard(ch)
-            if cluster_sizes.get(cluster, 0) >= min_cluster_size:
-                selected_clusters.add(cluster)
-            return own_stab
-        else:
-            return children_stab
 
-    root_cluster = max(all_clusters)
-    select_clusters(root_cluster)
+def _nearest_selected_ancestor(children_ptr, children_idx, selected, n_points, root):
+    """Map each point to its lowest selected ancestor, or -1 if none."""
+    owner = np.full(root + 1, -1, dtype=np.int64)
+    for c in range(root, n_points - 1, -1):
+        o = c if selected[c] else owner[c]
+        for j in range(children_ptr[c], children_ptr[c + 1]):
+            owner[children_idx[j]] = o
+    return owner[:n_points]
+
+
+if njit is not None:
+    _select_eom_clusters = njit(cache=True)(_select_eom_clusters)
+    _nearest_selected_ancestor = njit(cache=True)(_nearest_selected_ancestor)
+
 
-    if not selected_clusters:
+def _extract_clusters_eom(tree, cluster_sizes, cluster_birth, n_clusters, n_points, min_cluster_size):
+    if len(tree) == 0:
+        return np.zeros(n_points, dtype=int)
+
+    parent_ids = tree[:, 0].astype(np.int64)
+    child_ids = tree[:, 1].astype(np.int64)
+    root = int(parent_ids.max())
+
+    order = np.argsort(parent_ids, kind='stable')
+    children_idx = child_ids[order]
+    children_ptr = np.searchsorted(parent_ids[order], np.arange(root + 2))
+
+    # Every cluster is merged away exactly once, so its death lambda is the
+    # lambda of its single row as a child; the root keeps death == birth.
+    cluster_death = cluster_birth.copy()
+    cluster_death[child_ids] = tree[:, 3]
+    with np.errstate(invalid='ignore'):
+        cluster_stability = (cluster_death - cluster_birth) * cluster_sizes
+    cluster_stability[:n_points] = 0
+
+    selected = _select_eom_clusters(children_ptr, children_idx, cluster_stability,
+                                   cluster_sizes, n_points, root, min_cluster_size)
+    if not selected.any():
         return np.zeros(n_points, dtype=int)
 
-    labels = np.full(n_points, -1, dtype=int)
-
-    def get_points_in_cluster(cluster):
-        if cluster < n_points:
-            return {cluster}
-        pts = set()
-        for ch in cluster_children.get(cluster, []):
-            pts.update(get_points_in_cluster(ch))
-        return pts
-
-    for cidx, cluster in enumerate(sorted(selected_clusters)):
-        for p in get_points_in_cluster(cluster):
-            if labels[p] == -1:
-                labels[p] = cidx
-    labels[labels == -1] = 0
+    # Selected clusters are numbered in ascending id order and a point takes
+    # the label of the smallest selected cluster containing it.
+    owner = _nearest_selected_ancestor(children_ptr, children_idx, selected, n_points, root)
+    cluster_index = np.cumsum(selected) - 1
+    labels = np.where(owner >= 0, cluster_index[owner], 0)
+
     return labels
 
 
-def _hdbscan_clustering(data, min_cluster_size=5, min_samples=None):
+def _native_hdbscan_labels(data, min_cluster_size, min_samples):
+    n = len(data)
+    # Distances only feed comparisons and the MST, so float32 is ample and
+    # halves the bytes every O(n^2) pass moves.
+    if _parallel_prim is not None:
+        points = np.ascontiguousarray(data, dtype=np.float64)
+        core_dist = _parallel_core_distances(points, min_samples)
+        mst_edges = _parallel_prim(points, core_dist)
+    else:
+        condensed = pdist(data, metric='euclidean').astype(np.float32)
+        core_dist = _compute_core_distances(condensed, n, min_samples)
+        mst_edges = _minimum_spanning_tree(condensed, core_dist, n)
+    tree, csizes, cbirth, nc = _build_condensed_tree(mst_edges, n, min_cluster_size)
+    return _extract_clusters_eom(tree, csizes, cbirth, nc, n, min_cluster_size)
+
+
+def _hdbscan_clustering(data, min_cluster_size=5, min_samples=None, backend='native'):
     n = len(data)
     if n == 0:
         return np.array([], dtype=int), 0
@@ -353,19 +468,27 @@ def _hdbscan_clustering(data, min_cluster_size=5, min_samples=None):
     min_cluster_size = max(2, min(min_cluster_size, n // 2))
     min_samples = max(1, min(min_samples, n - 1))
 
-    distances = squareform(pdist(data, metric='euclidean'))
-    core_dist = _compute_core_distances(distances, min_samples)
-    mutual_reach = _compute_mutual_reachability_distance(distances, core_dist)
-    mst_edges = _minimum_spanning_tree_prim(mutual_reach)
-    tree, csizes, cbirth, nc = _build_condensed_tree(mst_edges, n, min_cluster_size)
-    labels = _extract_clusters_eom(tree, csizes, cbirth, nc, n, min_cluster_size)
+    if backend == 'hdbscan':
+        if _hdbscan_lib is None:
+            raise ImportError("hdbscan_backend='hdbscan' requires the hdbscan package "
+                              "(pip install 'ez-pair-graph[hdbscan]')")
+        # The library counts each point among its own min_samples neighbours;
+        # +1 gives the same core distance as the native implementation.
+        labels = _hdbscan_lib.HDBSCAN(min_cluster_size=min_cluster_size,
+                                       min_samples=min_samples + 1).fit_predict(data)
+    elif backend == 'native':
+        labels = _native_hdbscan_labels(data, min_cluster_size, min_samples)
+    else:
+        raise ValueError(f"Unknown HDBSCAN backend: {backend!r}. "
+                         "Choose 'native' or 'hdbscan'")
 
     unique_labels = np.unique(labels[labels >= 0])
     n_found = len(unique_labels)
     if n_found == 0:
         return np.zeros(n, dtype=int), 1
-    label_map = {old: new for new, old in enumerate(unique_labels)}
-    labels = np.array([label_map.get(l, 0) for l in labels])
+    remapped = np.searchsorted(unique_labels, labels)
+    remapped[labels < 0] = 0
+    labels = remapped
     return labels, n_found
 
 
@@ -374,7 +497,8 @@ def _hdbscan_clustering(data, min_cluster_size=5, min_samples=None):
 # ---------------------------------------------------------------------------
 
 def cluster_data(x, y, method='hierarchical', max_k=7, linkage_method='ward',
-                 min_cluster_size=5, min_samples=None, log2=False):
+                 min_cluster_size=5, min_samples=None, log2=False,
+                 hdbscan_backend='native'):
     """
     Cluster paired data by direction and return cluster labels.
 
@@ -393,12 +517,17 @@ def cluster_data(x, y, method='hierarchical', max_k=7, linkage_method='ward',
         Max clusters for hierarchical method.
     linkage_method : str
         Linkage for hierarchical ('ward', 'complete', 'average', 'single').
+        Methods without an O(n^2) scipy path are rejected above 2000 points.
     min_cluster_size : int
         Min cluster size for HDBSCAN.
     min_samples : int or None
         Min samples for HDBSCAN.
     log2 : bool
         Apply log2 transformation before clustering.
+    hdbscan_backend : str
+        'native' (default) for the built-in HDBSCAN, or 'hdbscan' for the
+        optional hdbscan package. The package selects clusters by its own
+        rules, so its labels can differ from the native ones.
 
     Returns
     -------
@@ -423,29 +552,23 @@ def cluster_data(x, y, method='hierarchical', max_k=7, linkage_method='ward',
     data = np.column_stack([x, y])
 
     # Split by direction (same as preparation_1.py)
-    pos_indices = []
-    neg_indices = []
-    for i in range(n):
-        diff = y[i] - x[i]
-        if diff >= 0:
-            pos_indices.append(i)
-        else:
-            neg_indices.append(i)
+    mask = y - x >= 0
+    pos_indices = np.nonzero(mask)[0]
+    neg_indices = np.nonzero(~mask)[0]
 
     all_clusters = np.zeros(n, dtype=int)
     cluster_offset = 0
 
-    pos_data = data[pos_indices] if pos_indices else np.array([])
-    neg_data = data[neg_indices] if neg_indices else np.array([])
+    pos_data = data[pos_indices]
+    neg_data = data[neg_indices]
 
     if len(pos_data) > 0:
         if method == 'hierarchical':
             pc, pk = _hierarchical_clustering(pos_data, max_k=max_k, method=linkage_method)
         else:
             pc, pk = _hdbscan_clustering(pos_data, min_cluster_size=min_cluster_size,
-                                          min_samples=min_samples)
-        for i, idx in enumerate(pos_indices):
-            all_clusters[idx] = pc[i]
+                                          min_samples=min_samples, backend=hdbscan_backend)
+        all_clusters[pos_indices] = pc
         cluster_offset = pc.max() + 1 if len(pc) > 0 else 0
 
     if len(neg_data) > 0:
@@ -453,9 +576,8 @@ def cluster_data(x, y, method='hierarchical', max_k=7, linkage_method='ward',
             nc, nk = _hierarchical_clustering(neg_data, max_k=max_k, method=linkage_method)
         else:
             nc, nk = _hdbscan_clustering(neg_data, min_cluster_size=min_cluster_size,
-                                          min_samples=min_samples)
-        for i, idx in enumerate(neg_indices):
-            all_clusters[idx] = nc[i] + cluster_offset
+                                          min_samples=min_samples, backend=hdbscan_backend)
+        all_clusters[neg_indices] = nc + cluster_offset
 
     return {
         'clusters': all_clusters,
@@ -483,7 +605,9 @@ def _calculate_stats(values):
     n = len(values)
     if n == 0:
         return 0, 0, 0, 0, 0
-    sv = sorted(values)
+    # Python floats, accumulated left to right in sorted order; ndarray.mean
+    # sums pairwise and can change the last bit.
+    sv = np.sort(np.asarray(values, dtype=np.float64)).tolist()
     mean = sum(sv) / n
     q1i, q2i, q3i = _calculate_quartile_indices(n)
     return mean, sv[q1i], sv[q2i], sv[q3i], n
@@ -506,38 +630,35 @@ def compute_statistics(x, y, clusters):
     y = np.asarray(y, dtype=float)
     clusters = np.asarray(clusters, dtype=int)
 
-    groups = {}
-    for i in range(len(x)):
-        c = int(clusters[i])
-        if c not in groups:
-            groups[c] = []
-        diff = float(y[i] - x[i])
-        groups[c].append([float(x[i]), float(y[i]), diff])
+    diff = y - x
+
+    # Stable sort by cluster id, then split into one index block per cluster.
+    order = np.argsort(clusters, kind='stable')
+    keys, starts = np.unique(clusters[order], return_index=True)
 
     stats_results = {}
-    for cluster in sorted(groups.keys()):
-        gd = groups[cluster]
-        xv = [p[0] for p in gd]
-        yv = [p[1] for p in gd]
-        dv = [p[2] for p in gd]
-        m = len(gd)
+    for cluster, idx in zip(keys.tolist(), np.split(order, starts[1:])):
+        xv = x[idx]
+        yv = y[idx]
+        dv = diff[idx]
+        m = len(idx)
 
         x_mean, x_q1, x_q2, x_q3, _ = _calculate_stats(xv)
         y_mean, y_q1, y_q2, y_q3, _ = _calculate_stats(yv)
 
-        sorted_by_x = sorted(gd, key=lambda item: item[0], reverse=True)
-        sorted_by_diff = sorted(gd, key=lambda item: item[2], reverse=True)
+        sorted_by_x = np.sort(xv)[::-1].tolist()
+        sorted_by_diff = np.sort(dv)[::-1].tolist()
 
         q1_idx, q2_idx, q3_idx = _calculate_quartile_indices(m)
 
         if q2_idx is not None:
-            q2_start = sorted_by_x[q2_idx][0]
-            q2_diff = sorted_by_diff[q2_idx][2]
+            q2_start = sorted_by_x[q2_idx]
+            q2_diff = sorted_by_diff[q2_idx]
             calc_y_q2 = q2_start + q2_diff
-            q1_start = sorted_by_x[q1_idx][0]
-            q1_diff = sorted_by_diff[q1_idx][2]
-            q3_start = sorted_by_x[q3_idx][0]
-            q3_diff = sorted_by_diff[q3_idx][2]
+            q1_start = sorted_by_x[q1_idx]
+            q1_diff = sorted_by_diff[q1_idx]
+            q3_start = sorted_by_x[q3_idx]
+            q3_diff = sorted_by_diff[q3_idx]
         else:
             q2_start = x_q2
             q2_diff = y_q2 - x_q2
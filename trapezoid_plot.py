@@ -5,21 +5,134 @@
 #E-mail: akihiro.ezoe@riken.jp
 
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+matplotlib.rcParams['interactive'] = False
+matplotlib.rcParams['figure.max_open_warning'] = 0
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_pdf import PdfPages
-from matplotlib.patches import Rectangle
-import pandas as pd
+from matplotlib.patches import Rectangle, Polygon
+from matplotlib.collections import LineCollection
 import os
 import sys
 import argparse
 import json
 import io
 
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+# Optional: with Numba installed, classify_pairs runs as one compiled loop
+# (cached on disk after the first run).
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+CLUSTERED_DATA_DTYPES = {'X': np.float64, 'Y': np.float64, 'Cluster': np.int64}
+
 
 def apply_log2_transform(data, min_value=1e-10):
     data = np.array(data, dtype=float)
-    data = np.where(data <= 0, min_value, data)
-    return np.log2(data), 0
+    np.copyto(data, min_value, where=data <= 0)
+    return np.log2(data, out=data), 0
+
+
+def read_table(path, dtype):
+    return pd.read_csv(path, sep=r'\s+', engine='c', header=0, dtype=dtype, memory_map=True)
+
+
+def cached_read_table(path, dtype, use_cache=True, log2_columns=()):
+    cache_path = path + ('.log2.npz' if log2_columns else '.npz')
+    if (use_cache and os.path.exists(cache_path)
+            and os.stat(cache_path).st_mtime_ns > os.stat(path).st_mtime_ns):
+        with np.load(cache_path, allow_pickle=False) as cached:
+            df = pd.DataFrame({name: cached[name] for name in cached.files})
+        # Another script may have written the cache with its own column dtypes.
+        return df.astype({name: t for name, t in dtype.items() if name in df.columns})
+    df = read_table(path, dtype)
+    for name in log2_columns:
+        df[name], _ = apply_log2_transform(df[name])
+    if use_cache:
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **{name: df[name].to_numpy() for name in df.columns})
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+    return df
+
+
+def read_pairs(path, use_cache=True, log2=False):
+    if pd is not None:
+        data = cached_read_table(path, CLUSTERED_DATA_DTYPES, use_cache,
+                                 log2_columns=('X', 'Y') if log2 else ())
+        return data['X'].to_numpy(dtype=np.float64), data['Y'].to_numpy(dtype=np.float64)
+    data = np.loadtxt(path, skiprows=1, usecols=(0, 1), dtype=np.float64, ndmin=2)
+    if log2:
+        data, _ = apply_log2_transform(data)
+    return data[:, 0].copy(), data[:, 1].copy()
+
+
+def _classify_pairs_loop(val1, val2):
+    n = val1.shape[0]
+    diff = np.empty(n, dtype=val1.dtype)
+    up_idx = np.empty(n, dtype=np.int64)
+    tie_idx = np.empty(n, dtype=np.int64)
+    down_idx = np.empty(n, dtype=np.int64)
+    num_up = 0
+    num_tie = 0
+    num_down = 0
+    
+    for i in range(n):
+        d = val2[i] - val1[i]
+        diff[i] = d
+        if d > 0:
+            up_idx[num_up] = i
+            num_up += 1
+        elif d == 0:
+            tie_idx[num_tie] = i
+            num_tie += 1
+        elif d < 0:
+            down_idx[num_down] = i
+            num_down += 1
+    
+    up_idx = up_idx[:num_up]
+    tie_idx = tie_idx[:num_tie]
+    down_idx = down_idx[:num_down]
+    
+    sorted_up_idx = up_idx[np.argsort(-val1[up_idx], kind='mergesort')]
+    sorted_down_idx = down_idx[np.argsort(-val1[down_idx], kind='mergesort')]
+    
+    return diff, up_idx, tie_idx, down_idx, sorted_up_idx, sorted_down_idx
+
+
+def _classify_pairs_numpy(val1, val2):
+    diff = val2 - val1
+    
+    up_idx = np.flatnonzero(diff > 0)
+    tie_idx = np.flatnonzero(diff == 0)
+    down_idx = np.flatnonzero(diff < 0)
+    
+    sorted_up_idx = up_idx[np.argsort(-val1[up_idx], kind='stable')]
+    sorted_down_idx = down_idx[np.argsort(-val1[down_idx], kind='stable')]
+    
+    return diff, up_idx, tie_idx, down_idx, sorted_up_idx, sorted_down_idx
+
+
+if njit is not None:
+    classify_pairs = njit(cache=True)(_classify_pairs_loop)
+else:
+    classify_pairs = _classify_pairs_numpy
 
 
 def calculate_quartiles(length):
@@ -34,41 +147,46 @@ def calculate_quartiles(length):
 
 
 def check_outliers_extent(data):
-    if not data or len(data) <= 4:
+    if data is None or len(data) <= 4:
         return False
     
     if isinstance(data[0], list):
-        flat_data = []
-        for sublist in data:
-            flat_data.extend(sublist)
-        data = flat_data
+        data = np.concatenate(data)
     
-    sorted_data = sorted(data)
+    arr = np.asarray(data, dtype=np.float64)
     
-    n = len(sorted_data)
+    n = len(arr)
     q1_idx = int(n / 4)
     q3_idx = int(3 * n / 4)
     
-    q1 = sorted_data[q1_idx]
-    q3 = sorted_data[q3_idx]
+    # Only the two order statistics are needed, so a partition replaces the sort.
+    partitioned = np.partition(arr, [q1_idx, q3_idx])
+    q1 = partitioned[q1_idx]
+    q3 = partitioned[q3_idx]
     
     iqr = q3 - q1
     lower_threshold = q1 - 1.5 * iqr
     upper_threshold = q3 + 1.5 * iqr
     
-    outliers = [x for x in sorted_data if x < lower_threshold or x > upper_threshold]
-    
-    if not outliers:
+    outlier_mask = (arr < lower_threshold) | (arr > upper_threshold)
+    if not outlier_mask.any():
         return False
     
-    data_range = max(sorted_data) - min(sorted_data)
+    data_min = arr.min()
+    data_max = arr.max()
+    data_range = data_max - data_min
     
-    outlier_min = min(outliers)
-    outlier_max = max(outliers)
+    outliers = arr[outlier_mask]
+    outlier_min = outliers.min()
+    outlier_max = outliers.max()
     
-    non_outliers = [x for x in sorted_data if lower_threshold <= x <= upper_threshold]
-    non_outlier_min = min(non_outliers) if non_outliers else min(sorted_data)
-    non_outlier_max = max(non_outliers) if non_outliers else max(sorted_data)
+    non_outliers = arr[~outlier_mask]
+    if len(non_outliers):
+        non_outlier_min = non_outliers.min()
+        non_outlier_max = non_outliers.max()
+    else:
+        non_outlier_min = data_min
+        non_outlier_max = data_max
     
     outlier_extent = 0
     if outlier_min < non_outlier_min:
@@ -76,20 +194,21 @@ def check_outliers_extent(data):
     if outlier_max > non_outlier_max:
         outlier_extent += outlier_max - non_outlier_max
     
-    return outlier_extent > data_range / 3
+    return bool(outlier_extent > data_range / 3)
 
 
-def get_whisker_range(data):
-    sorted_data = sorted(data)
-    q1 = np.percentile(sorted_data, 25)
-    q3 = np.percentile(sorted_data, 75)
+def get_whisker_range(data, quartiles=None):
+    data = np.asarray(data, dtype=np.float64)
+    if quartiles is None:
+        quartiles = np.percentile(data, [25, 50, 75])
+    q1, _, q3 = quartiles
     iqr = q3 - q1
     
     lower_whisker = q1 - 1.5 * iqr
     upper_whisker = q3 + 1.5 * iqr
     
-    whisker_min = min([x for x in sorted_data if x >= lower_whisker])
-    whisker_max = max([x for x in sorted_data if x <= upper_whisker])
+    whisker_min = data[data >= lower_whisker].min()
+    whisker_max = data[data <= upper_whisker].max()
     
     return whisker_min, whisker_max
 
@@ -102,8 +221,14 @@ def export_json(output_path, boxplot_data, bands_data, quartile_lines_data, stat
         'quartile_bands': bands_data,
         'quartile_lines': quartile_lines_data
     }
-    with open(output_path, 'w') as f:
-        json.dump(json_data, f, indent=2)
+    # Boxplot data_points are float64 arrays; orjson serialises them natively.
+    if orjson is not None:
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(json_data,
+                                 option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+    else:
+        with open(output_path, 'w') as f:
+            json.dump(json_data, f, indent=2, default=lambda arr: arr.tolist())
 
 
 def export_html(output_path, svg_content, title):
@@ -137,12 +262,11 @@ def create_visualization(sabun_up, sabun_tie, sabun_down, sorted_sabun_up, sorte
     x_pos = 1.0
     y_pos = 1.4
     
-    all_data = [
-        [item[0] for item in sorted_sabun_up + sorted_sabun_down + sabun_tie], 
-        [item[1] for item in sorted_sabun_up + sorted_sabun_down + sabun_tie]
-    ]
+    groups = (sorted_sabun_up, sorted_sabun_down, sabun_tie)
+    all_data = [np.concatenate([g[:, 0] for g in groups]),
+                np.concatenate([g[:, 1] for g in groups])]
     
-    hide_outliers = check_outliers_extent([item for sublist in all_data for item in sublist])
+    hide_outliers = check_outliers_extent(np.concatenate(all_data))
     
     gray_color = 'gray'
     
@@ -159,8 +283,12 @@ def create_visualization(sabun_up, sabun_tie, sabun_down, sorted_sabun_up, sorte
         patch.set_edgecolor(gray_color)
         patch.set_alpha(0.8)
     
-    whisker1_min, whisker1_max = get_whisker_range(all_data[0])
-    whisker2_min, whisker2_max = get_whisker_range(all_data[1])
+    # q1/median/q3 per group, shared by the whiskers, the outlier filter and the export
+    quartiles0 = np.percentile(all_data[0], [25, 50, 75])
+    quartiles1 = np.percentile(all_data[1], [25, 50, 75])
+    
+    whisker1_min, whisker1_max = get_whisker_range(all_data[0], quartiles0)
+    whisker2_min, whisker2_max = get_whisker_range(all_data[1], quartiles1)
     
     y_min, y_max = ax.get_ylim()
     
@@ -176,22 +304,20 @@ def create_visualization(sabun_up, sabun_tie, sabun_down, sorted_sabun_up, sorte
     ax.plot([y_pos, y_pos], [whisker2_min, whisker2_max], color=gray_color, linewidth=1, zorder=6)
     
     if no_outliers:
-        data0 = np.array(all_data[0])
-        data1 = np.array(all_data[1])
-        q1_0, q3_0 = np.percentile(data0, [25, 75])
-        q1_1, q3_1 = np.percentile(data1, [25, 75])
+        q1_0, _, q3_0 = quartiles0
+        q1_1, _, q3_1 = quartiles1
         iqr_0, iqr_1 = q3_0 - q1_0, q3_1 - q1_1
         lower_0, upper_0 = q1_0 - 1.5 * iqr_0, q3_0 + 1.5 * iqr_0
         lower_1, upper_1 = q1_1 - 1.5 * iqr_1, q3_1 + 1.5 * iqr_1
         
-        sorted_sabun_up = [item for item in sorted_sabun_up 
-                          if lower_0 <= item[0] <= upper_0 and lower_1 <= item[1] <= upper_1]
-        sorted_sabun_down = [item for item in sorted_sabun_down 
-                            if lower_0 <= item[0] <= upper_0 and lower_1 <= item[1] <= upper_1]
-        sabun_up = [item for item in sabun_up 
-                   if lower_0 <= item[0] <= upper_0 and lower_1 <= item[1] <= upper_1]
-        sabun_down = [item for item in sabun_down 
-                     if lower_0 <= item[0] <= upper_0 and lower_1 <= item[1] <= upper_1]
+        def whisker_mask(arr):
+            return ((arr[:, 0] >= lower_0) & (arr[:, 0] <= upper_0) &
+                    (arr[:, 1] >= lower_1) & (arr[:, 1] <= upper_1))
+
+        sorted_sabun_up = sorted_sabun_up[whisker_mask(sorted_sabun_up)]
+        sorted_sabun_down = sorted_sabun_down[whisker_mask(sorted_sabun_down)]
+        sabun_up = sabun_up[whisker_mask(sabun_up)]
+        sabun_down = sabun_down[whisker_mask(sabun_down)]
         
         filtered_up = num_up_total - len(sabun_up)
         filtered_down = num_down_total - len(sabun_down)
@@ -225,52 +351,58 @@ def create_visualization(sabun_up, sabun_tie, sabun_down, sorted_sabun_up, sorte
             'position': x_pos,
             'whisker_min': float(whisker1_min),
             'whisker_max': float(whisker1_max),
-            'q1': float(np.percentile(all_data[0], 25)),
-            'median': float(np.percentile(all_data[0], 50)),
-            'q3': float(np.percentile(all_data[0], 75)),
-            'data_points': [float(x) for x in all_data[0]]
+            'q1': float(quartiles0[0]),
+            'median': float(quartiles0[1]),
+            'q3': float(quartiles0[2]),
+            'data_points': np.ascontiguousarray(all_data[0], dtype=np.float64)
         },
         {
             'label': 'Group2 (Y)',
             'position': y_pos,
             'whisker_min': float(whisker2_min),
             'whisker_max': float(whisker2_max),
-            'q1': float(np.percentile(all_data[1], 25)),
-            'median': float(np.percentile(all_data[1], 50)),
-            'q3': float(np.percentile(all_data[1], 75)),
-            'data_points': [float(x) for x in all_data[1]]
+            'q1': float(quartiles1[0]),
+            'median': float(quartiles1[1]),
+            'q3': float(quartiles1[2]),
+            'data_points': np.ascontiguousarray(all_data[1], dtype=np.float64)
         }
     ]
     
     bands_data = []
     quartile_lines_data = []
     
-    if sabun_up:
+    if len(sabun_up):
         num_up_filtered = len(sorted_sabun_up)
         q1_idx, q2_idx, q3_idx = calculate_quartiles(num_up_filtered)
         
-        sorted_by_slope_up = sorted(sabun_up.copy(), key=lambda x: x[2], reverse=True)
+        # Only three ranks of the descending slope order are read, so partition
+        # the negated slopes instead of sorting them.
+        slopes_up = -np.partition(-sabun_up[:, 2], [q1_idx, q2_idx, q3_idx])
         
         q1_start = sorted_sabun_up[q1_idx][0]
-        q1_diff = sorted_by_slope_up[q1_idx][2]
+        q1_diff = slopes_up[q1_idx]
         q1_end = q1_start + q1_diff
         
         q2_start = sorted_sabun_up[q2_idx][0]
-        q2_diff = sorted_by_slope_up[q2_idx][2]
+        q2_diff = slopes_up[q2_idx]
         q2_end = q2_start + q2_diff
         
         q3_start = sorted_sabun_up[q3_idx][0]
-        q3_diff = sorted_by_slope_up[q3_idx][2]
+        q3_diff = slopes_up[q3_idx]
         q3_end = q3_start + q3_diff
         
         up_line_color = (0, up_color_intensity, 0)
-        ax.plot([x_pos, y_pos], [q1_start, q1_end], color=up_line_color, linestyle=':', linewidth=2, alpha=up_alpha, zorder=up_zorder)
-        ax.plot([x_pos, y_pos], [q2_start, q2_end], color=up_line_color, linestyle='-', linewidth=up_width, alpha=up_alpha, zorder=up_zorder)
-        ax.plot([x_pos, y_pos], [q3_start, q3_end], color=up_line_color, linestyle=':', linewidth=2, alpha=up_alpha, zorder=up_zorder)
+        quartile_segments = [[(x_pos, q1_start), (y_pos, q1_end)],
+                             [(x_pos, q2_start), (y_pos, q2_end)],
+                             [(x_pos, q3_start), (y_pos, q3_end)]]
+        ax.add_collection(LineCollection(quartile_segments, colors=[up_line_color],
+                                         linestyles=[':', '-', ':'], linewidths=[2, up_width, 2],
+                                         alpha=up_alpha, zorder=up_zorder))
         
         x_coords = [x_pos, y_pos, y_pos, x_pos]
         y_coords = [q1_start, q1_end, q3_end, q3_start]
-        ax.fill(x_coords, y_coords, color='green', alpha=0.2, zorder=8)
+        ax.add_patch(Polygon(np.column_stack([x_coords, y_coords]), color='green', alpha=0.2, zorder=8))
+        ax.autoscale_view()
         
         if show_numbers:
             mid_x = (x_pos + y_pos) / 2
@@ -317,32 +449,36 @@ def create_visualization(sabun_up, sabun_tie, sabun_down, sorted_sabun_up, sorte
             'style': 'dotted', 'color': f'rgb(0, {int(up_color_intensity*255)}, 0)', 'width': 2
         })
     
-    if sabun_down:
+    if len(sabun_down):
         num_down_filtered = len(sorted_sabun_down)
         q1_idx, q2_idx, q3_idx = calculate_quartiles(num_down_filtered)
         
-        sorted_by_slope_down = sorted(sabun_down.copy(), key=lambda x: x[2], reverse=True)
+        slopes_down = -np.partition(-sabun_down[:, 2], [q1_idx, q2_idx, q3_idx])
         
         q1_start = sorted_sabun_down[q1_idx][0]
-        q1_diff = sorted_by_slope_down[q1_idx][2]
+        q1_diff = slopes_down[q1_idx]
         q1_end = q1_start + q1_diff
         
         q2_start = sorted_sabun_down[q2_idx][0]
-        q2_diff = sorted_by_slope_down[q2_idx][2]
+        q2_diff = slopes_down[q2_idx]
         q2_end = q2_start + q2_diff
         
         q3_start = sorted_sabun_down[q3_idx][0]
-        q3_diff = sorted_by_slope_down[q3_idx][2]
+        q3_diff = slopes_down[q3_idx]
         q3_end = q3_start + q3_diff
         
         down_line_color = (down_color_intensity, 0, 0)
-        ax.plot([x_pos, y_pos], [q1_start, q1_end], color=down_line_color, linestyle=':', linewidth=2, alpha=down_alpha, zorder=down_zorder)
-        ax.plot([x_pos, y_pos], [q2_start, q2_end], color=down_line_color, linestyle='-', linewidth=down_width, alpha=down_alpha, zorder=down_zorder)
-        ax.plot([x_pos, y_pos], [q3_start, q3_end], color=down_line_color, linestyle=':', linewidth=2, alpha=down_alpha, zorder=down_zorder)
+        quartile_segments = [[(x_pos, q1_start), (y_pos, q1_end)],
+                             [(x_pos, q2_start), (y_pos, q2_end)],
+                             [(x_pos, q3_start), (y_pos, q3_end)]]
+        ax.add_collection(LineCollection(quartile_segments, colors=[down_line_color],
+                                         linestyles=[':', '-', ':'], linewidths=[2, down_width, 2],
+                                         alpha=down_alpha, zorder=down_zorder))
         
         x_coords = [x_pos, y_pos, y_pos, x_pos]
         y_coords = [q1_start, q1_end, q3_end, q3_start]
-        ax.fill(x_coords, y_coords, color='red', alpha=0.2, zorder=8)
+        ax.add_patch(Polygon(np.column_stack([x_coords, y_coords]), color='red', alpha=0.2, zorder=8))
+        ax.autoscale_view()
         
         if show_numbers:
             mid_x = (x_pos + y_pos) / 2
@@ -423,10 +559,10 @@ def create_visualization(sabun_up, sabun_tie, sabun_down, sorted_sabun_up, sorte
     if output_format == 'json':
         export_json(output_filename, boxplot_data, bands_data, quartile_lines_data, stats)
     elif output_format == 'html':
-        svg_buffer = io.StringIO()
+        svg_buffer = io.BytesIO()
         plt.savefig(svg_buffer, format='svg')
-        svg_content = svg_buffer.getvalue()
-        svg_content = svg_content[svg_content.find('<svg'):]
+        svg_bytes = svg_buffer.getvalue()
+        svg_content = svg_bytes[svg_bytes.find(b'<svg'):].decode('utf-8')
         export_html(output_filename, svg_content, title)
     elif output_format == 'pdf':
         with PdfPages(output_filename) as pdf:
@@ -449,26 +585,29 @@ def main():
                         help='Apply log2 transformation to values')
     parser.add_argument('--show-numbers', action='store_true',
                         help='Display sample counts (n) for up/down groups')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always re-parse input files instead of using the parsed-table cache')
     args = parser.parse_args()
     
-    cluster_data = pd.read_csv('output_EZ/clustered_data.txt', sep=r'\s+')
-    
     marker_file = 'output_EZ/.log2_transformed'
     already_transformed = os.path.exists(marker_file)
     
     use_log2 = args.log2
-    if use_log2 and not already_transformed:
+    transform_inputs = use_log2 and not already_transformed
+    if transform_inputs:
         print("Applying log2 transformation...")
-        cluster_data['X'], _ = apply_log2_transform(cluster_data['X'])
-        cluster_data['Y'], _ = apply_log2_transform(cluster_data['Y'])
     elif use_log2 and already_transformed:
         print("Data already log2 transformed in preparation step, skipping transformation.")
     
-    total_pairs = len(cluster_data)
-    differences = cluster_data['Y'] - cluster_data['X']
-    positive_count = int((differences > 0).sum())
-    negative_count = int((differences < 0).sum())
-    tie_count = int((differences == 0).sum())
+    val1, val2 = read_pairs('output_EZ/clustered_data.txt', not args.no_cache,
+                            log2=transform_inputs)
+    
+    diff, up_idx, tie_idx, down_idx, sorted_up_idx, sorted_down_idx = classify_pairs(val1, val2)
+    
+    total_pairs = len(val1)
+    positive_count = len(up_idx)
+    negative_count = len(down_idx)
+    tie_count = len(tie_idx)
     
     positive_pct = 100 * positive_count / total_pairs
     negative_pct = 100 * negative_count / total_pairs
@@ -479,24 +618,17 @@ def main():
     print(f"Descending (Y < X): {negative_count} ({negative_pct:.1f}%)")
     print(f"No change (tie): {tie_count} ({tie_pct:.1f}%)")
     
-    sabun_up = []
-    sabun_tie = []
-    sabun_down = []
-    
-    for _, row in cluster_data.iterrows():
-        val1 = row['X']
-        val2 = row['Y']
-        diff = val2 - val1
-        
-        if diff > 0:
-            sabun_up.append([val1, val2, diff])
-        elif diff == 0:
-            sabun_tie.append([val1, val2, diff])
-        else:
-            sabun_down.append([val1, val2, diff])
-    
-    sorted_sabun_up = sorted(sabun_up.copy(), key=lambda x: x[0], reverse=True)
-    sorted_sabun_down = sorted(sabun_down.copy(), key=lambda x: x[0], reverse=True)
+    # Column-major (the transpose of a 3 x n block) so that X, Y and Y - X are
+    # each a contiguous run for the column-wise sorts, masks and partitions.
+    def sabun(idx):
+        return np.vstack([val1[idx], val2[idx], diff[idx]]).T
+
+    sabun_up = sabun(up_idx)
+    sabun_tie = sabun(tie_idx)
+    sabun_down = sabun(down_idx)
+
+    sorted_sabun_up = sabun(sorted_up_idx)
+    sorted_sabun_down = sabun(sorted_down_idx)
     
     num_up_total = len(sabun_up)
     num_down_total = len(sabun_down)